@@ -1,30 +1,71 @@
 from fastapi import APIRouter, HTTPException, UploadFile, File, Form
 from typing import List, Optional
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse, FileResponse
+from pydantic import BaseModel, Field, TypeAdapter
 from ..services import LLMService, TestGenerator, AutoTestGenerator, QaseService, GitLabService, GitHubService
-from ..models.schemas import GenerateResponse, AutoTestResponse
+from ..models.schemas import GenerateResponse, AutoTestResponse, TestCase, TestStep, PriorityEnum
 import tempfile
 import os
+import hashlib
 import logging
-import json
-import openpyxl
-from openpyxl.styles import Font, Alignment
-from io import BytesIO
+import orjson
 from datetime import datetime
 
-import openpyxl
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, Border, Side, PatternFill
-from fastapi.responses import StreamingResponse
-from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from starlette.background import BackgroundTask
 
-from app.utils.xlsx_generator import generate_xlsx_bytes
+from app.utils.xlsx_generator import write_xlsx
+from app.utils.cache import LRUCache
 
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+# Service instances (and their HTTP clients) are reused across requests.
+# Keys carry a hash of the token, never the token itself.
+# Evicted services are not closed here: a request may still be using one, so their
+# clients are released by GC (or by close_services() if still cached at shutdown).
+_service_cache = LRUCache(maxsize=128)
+
+
+async def close_services() -> None:
+    """Close the HTTP clients of all cached services (called on app shutdown)"""
+    for service in _service_cache.values():
+        await service.aclose()
+    _service_cache.clear()
+
+
+def _token_key(token: Optional[str]) -> str:
+    return hashlib.sha256((token or "").encode("utf-8")).hexdigest()
+
+
+def _get_llm_service(provider: str, api_key: Optional[str], model: str) -> LLMService:
+    return _service_cache.get_or_create(
+        ("llm", provider, _token_key(api_key), model),
+        lambda: LLMService(provider=provider, api_key=api_key, model=model)
+    )
+
+
+def _get_qase_service(api_token: str, project_code: str) -> QaseService:
+    return _service_cache.get_or_create(
+        ("qase", _token_key(api_token), project_code),
+        lambda: QaseService(api_token=api_token, project_code=project_code)
+    )
+
+
+def _get_gitlab_service(api_token: str) -> GitLabService:
+    return _service_cache.get_or_create(
+        ("gitlab", _token_key(api_token)),
+        lambda: GitLabService(api_token=api_token)
+    )
+
+
+def _get_github_service(api_token: str) -> GitHubService:
+    return _service_cache.get_or_create(
+        ("github", _token_key(api_token)),
+        lambda: GitHubService(api_token=api_token)
+    )
+
 
 class TestCaseStep(BaseModel):
     step: Optional[int] = None
@@ -44,6 +85,17 @@ class TestCaseForXlsx(BaseModel):
 class XlsxRequest(BaseModel):
     test_cases: List[TestCaseForXlsx]
 
+class TestCaseForQase(TestCase):
+    id: str = "TC001"
+    title: str = "Generated Test"
+    description: str = ""
+    steps: List[TestStep] = []
+    expectedResult: str = Field("", alias="expected_result")
+    priority: PriorityEnum = PriorityEnum.medium
+
+# Parses and validates the uploaded JSON in a single pydantic-core pass
+_QASE_CASES_ADAPTER = TypeAdapter(List[TestCaseForQase])
+
 
 @router.post("/generate", response_model=GenerateResponse)
 async def generate_test_cases(
@@ -53,28 +105,18 @@ async def generate_test_cases(
     description: Optional[str] = Form(None),
     source_code: Optional[str] = Form(None),
     screenshots: List[UploadFile] = File(None),
-    videos: List[UploadFile] = File(None),
+    videos: List[UploadFile] = File(None),  # accepted for compatibility, not processed yet
     recordings: Optional[str] = Form(None)
 ):
     logger.info(f"Generate request received - provider: {provider}, model: {model}")
     try:
-        llm_service = LLMService(provider=provider, api_key=api_key, model=model)
+        llm_service = _get_llm_service(provider, api_key, model)
         test_generator = TestGenerator(llm_service)
         images_data = []
         if screenshots:
             for screenshot in screenshots:
                 content = await screenshot.read()
                 images_data.append(content)
-        if videos:
-            for video in videos:
-                content = await video.read()
-                temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.mp4')
-                temp_file.write(content)
-                temp_file.close()
-                try:
-                    pass
-                finally:
-                    os.unlink(temp_file.name)
 
         response = await test_generator.generate(
             description=description,
@@ -125,31 +167,23 @@ async def generate_autotests(
     framework: str = Form("playwright"),
     language: str = Form("javascript"),
     screenshots: List[UploadFile] = File(None),
-    videos: List[UploadFile] = File(None)
+    videos: List[UploadFile] = File(None)  # accepted for compatibility, not processed yet
 ):
     logger.info(f"Autotest generation request received - provider: {provider}, framework: {framework}, language: {language}")
     try:
-        llm_service = LLMService(provider=provider, api_key=api_key, model=model)
+        llm_service = _get_llm_service(provider, api_key, model)
         auto_test_generator = AutoTestGenerator(llm_service)
+        # Parse the project context once here; the generator works with the dict
+        source_code_data = orjson.loads(source_code) if source_code else None
         images_data = []
         if screenshots:
             for screenshot in screenshots:
                 content = await screenshot.read()
                 images_data.append(content)
-        if videos:
-            for video in videos:
-                content = await video.read()
-                temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.mp4')
-                temp_file.write(content)
-                temp_file.close()
-                try:
-                    pass
-                finally:
-                    os.unlink(temp_file.name)
 
         response = await auto_test_generator.generate(
             description=description,
-            source_code=source_code,
+            source_code=source_code_data,
             framework=framework,
             language=language,
             images=images_data if images_data else None
@@ -164,6 +198,55 @@ async def generate_autotests(
         raise HTTPException(status_code=500, detail=f"Autotest generation failed: {str(e)}")
 
 
+@router.post("/generate-autotests/stream")
+async def generate_autotests_stream(
+    provider: str = Form(...),
+    api_key: Optional[str] = Form(None),
+    model: str = Form(...),
+    description: Optional[str] = Form(None),
+    source_code: Optional[str] = Form(None),
+    framework: str = Form("playwright"),
+    language: str = Form("javascript"),
+    screenshots: List[UploadFile] = File(None)
+):
+    """
+    Same input as /generate-autotests, but streams NDJSON frames:
+    {"type": "test_file" | "support_file", "file": {...}} per file as soon as it is generated,
+    then {"type": "readme", "readme": "..."}. A failure mid-stream is sent as {"type": "error", "detail": "..."}.
+    """
+    logger.info(f"Streaming autotest generation request received - provider: {provider}, framework: {framework}, language: {language}")
+    try:
+        llm_service = _get_llm_service(provider, api_key, model)
+        auto_test_generator = AutoTestGenerator(llm_service)
+        source_code_data = orjson.loads(source_code) if source_code else None
+        images_data = []
+        if screenshots:
+            for screenshot in screenshots:
+                content = await screenshot.read()
+                images_data.append(content)
+    except ValueError as e:
+        logger.error(f"Validation error in streaming autotest request: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def frames():
+        try:
+            async for frame in auto_test_generator.generate_stream(
+                description=description,
+                source_code=source_code_data,
+                framework=framework,
+                language=language,
+                images=images_data if images_data else None
+            ):
+                yield orjson.dumps(frame) + b"\n"
+            logger.info(f"Streaming autotest generation completed for provider: {provider}")
+        except Exception as e:
+            # Status and headers are already sent, so report the failure in-band
+            logger.error(f"Streaming autotest generation failed: {str(e)}", exc_info=True)
+            yield orjson.dumps({"type": "error", "detail": f"Autotest generation failed: {str(e)}"}) + b"\n"
+
+    return StreamingResponse(frames(), media_type="application/x-ndjson")
+
+
 @router.post("/qase/upload-test-cases")
 async def upload_test_cases_to_qase(
     api_token: str = Form(...),
@@ -172,38 +255,18 @@ async def upload_test_cases_to_qase(
 ):
     logger.info(f"Uploading test cases to Qase project: {project_code}")
     try:
-        qase_service = QaseService(api_token=api_token, project_code=project_code)
-
-        # Parse test cases JSON
-        test_cases_data = json.loads(test_cases)
-        uploaded_cases = []
-
-        for tc_data in test_cases_data:
-            # Convert dict to TestCase object
-            steps = [
-                TestStep(
-                    step=step["step"],
-                    action=step["action"],
-                    expected=step["expected"]
-                )
-                for step in tc_data.get("steps", [])
-            ]
-
-            test_case = TestCase(
-                id=tc_data.get("id", "TC001"),
-                title=tc_data.get("title", "Generated Test"),
-                description=tc_data.get("description", ""),
-                steps=steps,
-                expected_result=tc_data.get("expected_result", ""),
-                priority=tc_data.get("priority", "medium")
-            )
-
-            result = qase_service.create_test_case(test_case)
-            uploaded_cases.append(result)
+        qase_service = _get_qase_service(api_token, project_code)
+
+        # Parse and validate test cases JSON
+        cases = _QASE_CASES_ADAPTER.validate_json(test_cases)
+        uploaded_cases = await qase_service.create_test_cases_bulk(cases)
 
         logger.info(f"Successfully uploaded {len(uploaded_cases)} test cases to Qase")
         return {"uploaded": len(uploaded_cases), "cases": uploaded_cases}
 
+    except ValueError as e:
+        logger.error(f"Validation error in Qase upload request: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Failed to upload test cases to Qase: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Qase upload failed: {str(e)}")
@@ -213,8 +276,8 @@ async def upload_test_cases_to_qase(
 async def get_qase_projects(api_token: str):
     logger.info("Fetching Qase projects")
     try:
-        qase_service = QaseService(api_token=api_token, project_code="")  # project_code not needed for this call
-        projects = qase_service.get_projects()
+        qase_service = _get_qase_service(api_token, "")  # project_code not needed for this call
+        projects = await qase_service.get_projects()
         return {"projects": projects}
     except Exception as e:
         logger.error(f"Failed to fetch Qase projects: {str(e)}", exc_info=True)
@@ -230,8 +293,8 @@ async def comment_gitlab_merge_request(
 ):
     logger.info(f"Adding comment to GitLab MR {mr_iid} in project {project_id}")
     try:
-        gitlab_service = GitLabService(api_token=api_token)
-        result = gitlab_service.create_merge_request_comment(project_id, mr_iid, comment)
+        gitlab_service = _get_gitlab_service(api_token)
+        result = await gitlab_service.create_merge_request_comment(project_id, mr_iid, comment)
         return {"success": True, "comment": result}
     except Exception as e:
         logger.error(f"Failed to comment on GitLab MR: {str(e)}", exc_info=True)
@@ -248,8 +311,8 @@ async def comment_github_pull_request(
 ):
     logger.info(f"Adding comment to GitHub PR {pr_number} in {owner}/{repo}")
     try:
-        github_service = GitHubService(api_token=api_token)
-        result = github_service.create_pull_request_comment(owner, repo, pr_number, comment)
+        github_service = _get_github_service(api_token)
+        result = await github_service.create_pull_request_comment(owner, repo, pr_number, comment)
         return {"success": True, "comment": result}
     except Exception as e:
         logger.error(f"Failed to comment on GitHub PR: {str(e)}", exc_info=True)
@@ -266,13 +329,13 @@ async def analyze_code_changes(
     logger.info(f"Analyzing code changes for {platform} item {mr_pr_id}")
     try:
         if platform.lower() == "gitlab":
-            gitlab_service = GitLabService(api_token=api_token)
-            changes = gitlab_service.get_merge_request_changes(project_id, mr_pr_id)
+            gitlab_service = _get_gitlab_service(api_token)
+            changes = await gitlab_service.get_merge_request_changes(project_id, mr_pr_id)
             analysis = gitlab_service.analyze_code_changes(changes)
         elif platform.lower() == "github":
             owner, repo = project_id.split("/")
-            github_service = GitHubService(api_token=api_token)
-            changes = github_service.get_pull_request_changes(owner, repo, mr_pr_id)
+            github_service = _get_github_service(api_token)
+            changes = await github_service.get_pull_request_changes(owner, repo, mr_pr_id)
             analysis = github_service.analyze_code_changes(changes)
         else:
             raise HTTPException(status_code=400, detail="Unsupported platform")
@@ -295,15 +358,26 @@ async def generate_test_cases_xlsx(request: XlsxRequest):
         if not raw_test_cases:
             raise HTTPException(status_code=400, detail="Нет тест-кейсов для генерации")
 
-        # Convert Pydantic models to dicts for the generator
-        test_cases_dicts = [tc.dict() for tc in raw_test_cases]
-        xlsx_bytes = generate_xlsx_bytes(test_cases_dicts)
-        stream = BytesIO(xlsx_bytes)
+        # Convert Pydantic models to dicts for the generator in a single pydantic-core pass
+        test_cases_dicts = request.model_dump()["test_cases"]
+
+        # Write to a temp file and stream it from disk instead of holding the workbook in memory
+        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx')
+        temp_file.close()
+        try:
+            # Workbook serialization is CPU-bound, keep it off the event loop
+            await run_in_threadpool(write_xlsx, test_cases_dicts, temp_file.name)
+        except Exception:
+            os.unlink(temp_file.name)
+            raise
+
         filename = f"test_cases_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.xlsx"
-        headers = {
-            "Content-Disposition": f'attachment; filename="{filename}"'
-        }
-        return StreamingResponse(stream, media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", headers=headers)
+        return FileResponse(
+            temp_file.name,
+            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            filename=filename,
+            background=BackgroundTask(os.unlink, temp_file.name)
+        )
     except HTTPException:
         raise
     except Exception as e:
@@ -1,41 +1,60 @@
-from anthropic import Anthropic
-from typing import List, Optional
-import base64
+from anthropic import AsyncAnthropic
+from typing import AsyncIterator, List, Optional
+from ..utils.image_utils import detect_image_media_type, encode_images_base64
 
 
 class AnthropicProvider:
     def __init__(self, api_key: str, model: str = "claude-3-opus-20240229"):
-        self.client = Anthropic(api_key=api_key)
+        self.client = AsyncAnthropic(api_key=api_key)
         self.model = model
 
+    async def aclose(self) -> None:
+        await self.client.close()
+
     async def generate(
         self,
         prompt: str,
         images: Optional[List[bytes]] = None,
         max_tokens: int = 4000
     ) -> str:
+        response = await self.client.messages.create(
+            model=self.model,
+            max_tokens=max_tokens,
+            messages=await self._build_messages(prompt, images)
+        )
+
+        return response.content[0].text
+
+    async def generate_stream(
+        self,
+        prompt: str,
+        images: Optional[List[bytes]] = None,
+        max_tokens: int = 4000
+    ) -> AsyncIterator[str]:
+        async with self.client.messages.stream(
+            model=self.model,
+            max_tokens=max_tokens,
+            messages=await self._build_messages(prompt, images)
+        ) as stream:
+            async for text in stream.text_stream:
+                yield text
+
+    async def _build_messages(self, prompt: str, images: Optional[List[bytes]]) -> List[dict]:
         messages = []
         
         if images:
             content = [{"type": "text", "text": prompt}]
-            for image in images:
-                base64_image = base64.b64encode(image).decode('utf-8')
+            for image, data in zip(images, await encode_images_base64(images)):
                 content.append({
                     "type": "image",
                     "source": {
                         "type": "base64",
-                        "media_type": "image/png",
-                        "data": base64_image
+                        "media_type": detect_image_media_type(image),
+                        "data": data
                     }
                 })
             messages.append({"role": "user", "content": content})
         else:
             messages.append({"role": "user", "content": prompt})
 
-        response = self.client.messages.create(
-            model=self.model,
-            max_tokens=max_tokens,
-            messages=messages
-        )
-
-        return response.content[0].text
\ No newline at end of file
+        return messages
\ No newline at end of file
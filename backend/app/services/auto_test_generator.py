@@ -1,12 +1,21 @@
-from typing import Optional, List, Dict, Any
-import json
+from typing import AsyncIterator, Optional, List, Dict, Any, Tuple
 import re
+import orjson
 import logging
 from .llm_service import LLMService
 from ..models.schemas import AutoTestResponse, AutoTestCase
+from ..utils.json_repair import escape_string_control_chars
 
 logger = logging.getLogger(__name__)
 
+# Паттерны компилируются один раз при импорте, а не на каждом разборе ответа
+_TRAILING_COMMA = re.compile(r',(\s*[}\]])')
+_MISSING_COMMA_OBJ = re.compile(r'}(\s*)"([^"]+)":')
+_MISSING_COMMA_ARR = re.compile(r'](\s*)"([^"]+)":')
+_TEST_FILES_BLOCK = re.compile(r'"test_files"\s*:\s*\[[\s\S]*?\]', re.IGNORECASE)
+# Строка формата "path -> content": путь до первой "->", пробелы по краям отбрасываются
+_FILE_LINE = re.compile(r'^[ \t]*(\S[^\n]*?)[ \t]*->[ \t]*(.*?)[ \t\r]*$', re.MULTILINE)
+
 
 class AutoTestGenerator:
     def __init__(self, llm_service: LLMService):
@@ -19,27 +28,24 @@ class AutoTestGenerator:
         framework: str = "playwright",
         language: str = "javascript"
     ) -> str:
-        prompt = f"""You are an expert QA automation engineer. Generate comprehensive automated test code based on the provided information.
+        # Собираем части в список и склеиваем один раз, без копирования на каждом +=
+        parts = ["""You are an expert QA automation engineer. Generate comprehensive automated test code based on the provided information.
 
-"""
+"""]
 
         if description:
-            prompt += f"**Feature Description:**\n{description}\n\n"
+            parts.append(f"**Feature Description:**\n{description}\n\n")
 
         if source_code:
-            source_data = json.loads(source_code) if isinstance(source_code, str) else source_code
-            prompt += "**Project Structure:**\n"
-            prompt += f"{source_data.get('structure', '')}\n\n"
-
-            if source_data.get('files'):
-                prompt += "**Key Source Files:**\n"
-                for file in source_data['files'][:10]:  # More files for autotests
-                    prompt += f"\nFile: {file['path']}\n"
-                    prompt += f"```{file['language']}\n"
+            parts.append(f"**Project Structure:**\n{source_code.get('structure', '')}\n\n")
+
+            if source_code.get('files'):
+                parts.append("**Key Source Files:**\n")
+                for file in source_code['files'][:10]:  # More files for autotests
                     content = file['content'][:2000]  # More content for autotests
-                    prompt += f"{content}\n```\n"
+                    parts.append(f"\nFile: {file['path']}\n```{file['language']}\n{content}\n```\n")
 
-        prompt += f"""
+        parts.append(f"""
 Generate automated tests using {framework} framework in {language}.
 
 Requirements:
@@ -71,14 +77,14 @@ Make sure to:
 - Add meaningful Russian comments (// комментарий)
 - Create modular, reusable code
 - Follow {framework} best practices
-"""
+""")
 
-        return prompt
+        return "".join(parts)
 
     async def generate(
         self,
         description: Optional[str],
-        source_code: Optional[str],
+        source_code: Optional[Dict[str, Any]],
         framework: str = "playwright",
         language: str = "javascript",
         images: Optional[List[bytes]] = None
@@ -93,48 +99,92 @@ Make sure to:
 
         return self.parse_response(response_text)
 
-    def parse_response(self, response_text: str) -> AutoTestResponse:
-        # Parse the new "path -> code" format
-        lines = response_text.strip().split('\n')
+    async def generate_stream(
+        self,
+        description: Optional[str],
+        source_code: Optional[Dict[str, Any]],
+        framework: str = "playwright",
+        language: str = "javascript",
+        images: Optional[List[bytes]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Yield NDJSON-ready frames: one per file as soon as its line is complete, then the readme"""
+        prompt = self.build_prompt(description, source_code, framework, language)
+
+        chunks = []
+        pending = ""  # незавершенная последняя строка
         test_files = []
-        support_files = []
+        emitted = 0
 
-        for line in lines:
-            line = line.strip()
-            if not line or '->' not in line:
+        async for chunk in self.llm_service.generate_stream(
+            prompt=prompt,
+            images=images,
+            max_tokens=6000  # More tokens for code generation
+        ):
+            chunks.append(chunk)
+            pending += chunk
+            if '\n' not in chunk:
                 continue
+            complete, pending = pending.rsplit('\n', 1)
+            for match in _FILE_LINE.finditer(complete):
+                emitted += 1
+                yield self._file_frame(match.group(1), match.group(2), test_files)
+
+        for match in _FILE_LINE.finditer(pending):
+            emitted += 1
+            yield self._file_frame(match.group(1), match.group(2), test_files)
+
+        if not emitted:
+            # Ответ не в формате path -> code: разбираем целиком через JSON fallback
+            logger.warning("No files streamed in path->code format, trying JSON fallback")
+            response = self._parse_json_fallback("".join(chunks))
+            for file in response.test_files:
+                yield {"type": "test_file", "file": file.model_dump()}
+            for file in response.support_files:
+                yield {"type": "support_file", "file": file.model_dump()}
+            yield {"type": "readme", "readme": response.readme}
+            return
+
+        yield {"type": "readme", "readme": self.generate_default_readme(test_files)}
+
+    def _file_frame(self, path: str, content: str, test_files: List[AutoTestCase]) -> Dict[str, Any]:
+        is_test, file = self._build_file(path, content)
+        if is_test:
+            test_files.append(file)
+        return {"type": "test_file" if is_test else "support_file", "file": file.model_dump()}
+
+    def _build_file(self, path: str, content: str) -> Tuple[bool, AutoTestCase]:
+        """Build a file entry from a "path -> content" pair; the flag is True for test files"""
+        # Determine if it's a test file or support file based on path
+        filename = path.split('/')[-1] or path.split('\\')[-1]
+
+        # Basic classification - can be improved
+        if 'test' in filename.lower() or 'spec' in filename.lower():
+            return True, AutoTestCase(
+                filename=filename,
+                content=content,
+                description=f"Test file: {filename}",
+                framework="playwright",
+                language="javascript"
+            )
+        return False, AutoTestCase(
+            filename=filename,
+            content=content,
+            description=f"Support file: {filename}",
+            framework="",
+            language=""
+        )
 
-            try:
-                path, content = line.split('->', 1)
-                path = path.strip()
-                content = content.strip()
-
-                # Determine if it's a test file or support file based on path
-                filename = path.split('/')[-1] or path.split('\\')[-1]
-
-                # Basic classification - can be improved
-                if 'test' in filename.lower() or 'spec' in filename.lower():
-                    test_file = AutoTestCase(
-                        filename=filename,
-                        content=content,
-                        description=f"Test file: {filename}",
-                        framework="playwright",
-                        language="javascript"
-                    )
-                    test_files.append(test_file)
-                else:
-                    support_file = AutoTestCase(
-                        filename=filename,
-                        content=content,
-                        description=f"Support file: {filename}",
-                        framework="",
-                        language=""
-                    )
-                    support_files.append(support_file)
-
-            except ValueError as e:
-                logger.warning(f"Error parsing line: {line}, error: {e}")
-                continue
+    def parse_response(self, response_text: str) -> AutoTestResponse:
+        # Parse the new "path -> code" format in one regex pass over the whole response
+        test_files = []
+        support_files = []
+
+        for match in _FILE_LINE.finditer(response_text):
+            is_test, file = self._build_file(match.group(1), match.group(2))
+            if is_test:
+                test_files.append(file)
+            else:
+                support_files.append(file)
 
         # If no files were parsed, try fallback JSON parsing
         if not test_files and not support_files:
@@ -151,74 +201,93 @@ Make sure to:
 
     def _parse_json_fallback(self, response_text: str) -> AutoTestResponse:
         # Fallback to JSON parsing if path->code format fails
-        json_patterns = [
-            r'```json\s*(\{[\s\S]*?"test_files"[\s\S]*?\})\s*```',  # JSON в markdown блоке с test_files
-            r'```\s*(\{[\s\S]*?"test_files"[\s\S]*?\})\s*```',     # JSON в code блоке с test_files
-            r'(\{[\s\S]*?"test_files"[\s\S]*?\})',  # JSON с test_files без markdown
-            r'(\{[\s\S]*?\})'  # Любой JSON объект (запасной вариант)
-        ]
+        data = self._load_test_files_json(response_text.strip())
+        if data is None:
+            logger.warning("No valid JSON found in response, using fallback")
+            return self.generate_fallback_response(response_text)
+
+        test_files = []
+        for tf_data in data.get("test_files", []):
+            try:
+                test_file = AutoTestCase(
+                    filename=tf_data.get("filename", "test.spec.js"),
+                    content=tf_data.get("content", ""),
+                    description=tf_data.get("description", ""),
+                    framework=tf_data.get("framework", "playwright"),
+                    language=tf_data.get("language", "javascript")
+                )
+                test_files.append(test_file)
+            except (KeyError, TypeError, ValueError, AttributeError) as e:
+                logger.warning(f"Error parsing test file: {e}, data: {tf_data}")
+                continue
+
+        support_files = []
+        for sf_data in data.get("support_files") or []:
+            try:
+                support_file = AutoTestCase(
+                    filename=sf_data.get("filename", "helper.js"),
+                    content=sf_data.get("content", ""),
+                    description=sf_data.get("description", ""),
+                    framework="",
+                    language=""
+                )
+                support_files.append(support_file)
+            except (KeyError, TypeError, ValueError, AttributeError) as e:
+                logger.warning(f"Error parsing support file: {e}, data: {sf_data}")
+                continue
+
+        readme = data.get("readme", self.generate_default_readme(test_files))
+
+        return AutoTestResponse(
+            test_files=test_files,
+            support_files=support_files,
+            readme=readme
+        )
+
+    def _load_test_files_json(self, text: str) -> Optional[Dict[str, Any]]:
+        """Находит в ответе JSON-объект с test_files или возвращает None.
+
+        Без regex-поиска объектов: ленивый шаблон "от { до ближайшей }" на длинном ответе
+        без JSON перебирает каждую "{" и дает квадратичное время.
+        """
+        # 1. Ответ целиком является JSON
+        try:
+            data = orjson.loads(text)
+        except orjson.JSONDecodeError:
+            data = None
+        if self._has_test_files(data):
+            return data
+
+        if '"test_files"' not in text:
+            return None
+
+        # 2. Сбалансированные {...} блоки из одного прохода сканера, самые длинные первыми
+        #    (в том числе JSON внутри ```json ... ``` блока)
+        for candidate in self._extract_json_candidates(text):
+            if '"test_files"' not in candidate:
+                continue
+            try:
+                data = orjson.loads(candidate)
+            except orjson.JSONDecodeError:
+                data = self._load_repaired(candidate)
+            if self._has_test_files(data):
+                return data
 
-        for pattern in json_patterns:
-            json_match = re.search(pattern, response_text, re.DOTALL)
-            if json_match:
-                try:
-                    json_str = json_match.group(1) if json_match.groups() else json_match.group()
-
-                    # Сначала пробуем парсить как есть
-                    try:
-                        data = json.loads(json_str)
-                    except json.JSONDecodeError:
-                        # Если не получилось, пытаемся исправить
-                        json_str = self._fix_json_string(json_str)
-                        data = json.loads(json_str)
-
-                    # Проверяем обязательные поля
-                    if "test_files" not in data:
-                        continue
-
-                    test_files = []
-                    for tf_data in data.get("test_files", []):
-                        try:
-                            test_file = AutoTestCase(
-                                filename=tf_data.get("filename", "test.spec.js"),
-                                content=tf_data.get("content", ""),
-                                description=tf_data.get("description", ""),
-                                framework=tf_data.get("framework", "playwright"),
-                                language=tf_data.get("language", "javascript")
-                            )
-                            test_files.append(test_file)
-                        except (KeyError, TypeError, ValueError) as e:
-                            logger.warning(f"Error parsing test file: {e}, data: {tf_data}")
-                            continue
-
-                    support_files = []
-                    for sf_data in data.get("support_files", []):
-                        try:
-                            support_file = AutoTestCase(
-                                filename=sf_data.get("filename", "helper.js"),
-                                content=sf_data.get("content", ""),
-                                description=sf_data.get("description", ""),
-                                framework="",
-                                language=""
-                            )
-                            support_files.append(support_file)
-                        except (KeyError, TypeError, ValueError) as e:
-                            logger.warning(f"Error parsing support file: {e}, data: {sf_data}")
-                            continue
-
-                    readme = data.get("readme", self.generate_default_readme(test_files))
-
-                    return AutoTestResponse(
-                        test_files=test_files,
-                        support_files=support_files,
-                        readme=readme
-                    )
-                except (json.JSONDecodeError, TypeError, ValueError) as e:
-                    logger.warning(f"JSON parsing failed: {e}, json_str: {json_str[:500]}...")
-                    continue
-
-        logger.warning("No valid JSON found in response, using fallback")
-        return self.generate_fallback_response(response_text)
+        # 3. Целого объекта нет (обрезанный JSON) - ремонтируем текст целиком
+        data = self._load_repaired(text)
+        return data if self._has_test_files(data) else None
+
+    def _load_repaired(self, json_str: str) -> Any:
+        try:
+            return self._load_repaired_json(json_str)
+        except orjson.JSONDecodeError as e:
+            logger.warning(f"JSON parsing failed: {e}, json_str: {json_str[:500]}...")
+            return None
+
+    @staticmethod
+    def _has_test_files(data: Any) -> bool:
+        # null, строка или объект вместо списка не годятся: такой ответ уходит в fallback
+        return isinstance(data, dict) and isinstance(data.get("test_files"), list)
 
     def generate_fallback_response(self, response_text: str) -> AutoTestResponse:
         test_file = AutoTestCase(
@@ -252,60 +321,51 @@ test('example test', async ({{ page }}) => {{
         )
 
     def generate_default_readme(self, test_files: List[AutoTestCase]) -> str:
-        readme = "# Автоматически сгенерированные тесты\n\n"
-        readme += "## Описание\n\n"
-        readme += "Этот набор тестов был автоматически сгенерирован на основе анализа кода проекта.\n\n"
-
-        readme += "## Файлы тестов\n\n"
-        for tf in test_files:
-            readme += f"- `{tf.filename}`: {tf.description}\n"
-
-        readme += "\n## Запуск тестов\n\n"
-        readme += "```bash\n"
-        readme += "# Установка зависимостей\n"
-        readme += "npm install\n\n"
-        readme += "# Запуск тестов\n"
-        readme += "npx playwright test\n"
-        readme += "```\n\n"
-
-        readme += "## Структура проекта\n\n"
-        readme += "Тесты организованы согласно лучшим практикам автоматизации тестирования.\n"
-
-        return readme
+        parts = [
+            "# Автоматически сгенерированные тесты\n\n"
+            "## Описание\n\n"
+            "Этот набор тестов был автоматически сгенерирован на основе анализа кода проекта.\n\n"
+            "## Файлы тестов\n\n"
+        ]
+        parts.extend(f"- `{tf.filename}`: {tf.description}\n" for tf in test_files)
+
+        parts.append(
+            "\n## Запуск тестов\n\n"
+            "```bash\n"
+            "# Установка зависимостей\n"
+            "npm install\n\n"
+            "# Запуск тестов\n"
+            "npx playwright test\n"
+            "```\n\n"
+            "## Структура проекта\n\n"
+            "Тесты организованы согласно лучшим практикам автоматизации тестирования.\n"
+        )
 
-    def _fix_json_string(self, json_str: str) -> str:
-        """Агрессивный JSON repair"""
-        import re
+        return "".join(parts)
 
+    def _load_repaired_json(self, json_str: str) -> Any:
+        """Агрессивный JSON repair; возвращает уже разобранные данные, без повторного json.loads"""
         # Сначала пробуем простой repair
-        repaired = self._simple_json_repair(json_str)
         try:
-            import json
-            json.loads(repaired)
-            return repaired
-        except:
+            return orjson.loads(self._simple_json_repair(json_str))
+        except orjson.JSONDecodeError:
             pass
 
         # Если не получилось, пробуем извлечь все возможные JSON кандидаты
-        candidates = self._extract_json_candidates(json_str)
-        for candidate in candidates:
+        for candidate in self._extract_json_candidates(json_str):
             try:
-                import json
-                json.loads(candidate)
-                return candidate
-            except:
+                return orjson.loads(candidate)
+            except orjson.JSONDecodeError:
                 continue
 
         # Если ничего не помогло, пробуем экстремальный fallback
-        return self._extreme_json_fallback(json_str)
+        return orjson.loads(self._extreme_json_fallback(json_str))
 
     def _extreme_json_fallback(self, json_str: str) -> str:
         """Экстремальный fallback для очень сломанного JSON"""
-        import re
-
         # Пытаемся найти хотя бы основные структуры
         # Ищем "test_files": [ ... ]
-        test_files_match = re.search(r'"test_files"\s*:\s*\[[\s\S]*?\]', json_str, re.IGNORECASE)
+        test_files_match = _TEST_FILES_BLOCK.search(json_str)
         if test_files_match:
             # Создаем минимальный валидный JSON
             return f'{{"test_files": {test_files_match.group(0)}}}'
@@ -315,8 +375,6 @@ test('example test', async ({{ page }}) => {{
 
     def _simple_json_repair(self, json_str: str) -> str:
         """Простой JSON repair"""
-        import re
-
         # Удаляем лишние пробелы
         json_str = json_str.strip()
 
@@ -327,40 +385,11 @@ test('example test', async ({{ page }}) => {{
         if start_brace != -1 and last_brace != -1 and last_brace > start_brace:
             json_str = json_str[start_brace:last_brace + 1]
 
-        # Исправляем проблемы внутри строк
-        in_string = False
-        escape_next = False
-        result = []
-
-        for char in json_str:
-            if escape_next:
-                result.append(char)
-                escape_next = False
-                continue
-
-            if char == '\\':
-                escape_next = True
-                result.append(char)
-                continue
-
-            if char == '"' and not escape_next:
-                in_string = not in_string
-                result.append(char)
-                continue
-
-            if in_string and char == '\n':
-                result.append('\\n')
-            elif in_string and char == '\t':
-                result.append(' ')
-            elif in_string and char == '\r':
-                continue
-            else:
-                result.append(char)
-
-        json_str = ''.join(result)
+        # Исправляем проблемы внутри строк одним проходом регулярки вместо посимвольного цикла
+        json_str = escape_string_control_chars(json_str)
 
         # Удаляем висячие запятые
-        json_str = re.sub(r',(\s*[}\]])', r'\1', json_str)
+        json_str = _TRAILING_COMMA.sub(r'\1', json_str)
 
         # Исправляем незавершенные кавычки
         quote_count = json_str.count('"')
@@ -368,14 +397,16 @@ test('example test', async ({{ page }}) => {{
             json_str += '"'
 
         # Исправляем отсутствующие запятые между свойствами
-        json_str = re.sub(r'}(\s*)"([^"]+)":', r'},$1"$2":', json_str)
-        json_str = re.sub(r'](\s*)"([^"]+)":', r'],$1"$2":', json_str)
+        json_str = _MISSING_COMMA_OBJ.sub(r'},\1"\2":', json_str)
+        json_str = _MISSING_COMMA_ARR.sub(r'],\1"\2":', json_str)
 
         return json_str
 
     def _extract_json_candidates(self, json_str: str) -> list:
         """Извлекает все возможные JSON кандидаты"""
         candidates = []
+        longest = 0
+        text_len = len(json_str)
 
         # Ищем все возможные JSON объекты
         brace_count = 0
@@ -399,6 +430,9 @@ test('example test', async ({{ page }}) => {{
             if not in_string:
                 if char == '{':
                     if brace_count == 0:
+                        # Оставшийся текст короче найденного кандидата: длиннее уже не будет
+                        if text_len - i <= longest:
+                            break
                         start_pos = i
                     brace_count += 1
                 elif char == '}':
@@ -406,6 +440,7 @@ test('example test', async ({{ page }}) => {{
                     if brace_count == 0 and start_pos != -1:
                         candidate = json_str[start_pos:i + 1]
                         candidates.append(candidate)
+                        longest = max(longest, len(candidate))
 
         # Сортируем по длине, самые длинные первыми
         return sorted(candidates, key=len, reverse=True)
\ No newline at end of file
@@ -1,19 +1,80 @@
-import requests
+import asyncio
 from typing import Dict, Any, List, Optional
 import json
+from ..utils.cache import LRUCache, TTLCache
+from .vcs_service import VCSService
 
 
-class GitHubService:
+# Same shape as the REST "files" entries analyze_code_changes consumes
+_GRAPHQL_FILE_STATUS = {
+    "ADDED": "added",
+    "DELETED": "removed",
+    "MODIFIED": "modified",
+    "RENAMED": "renamed",
+    "COPIED": "copied",
+    "CHANGED": "changed",
+}
+
+_PR_FIELDS_FRAGMENT = """
+fragment PRFields on PullRequest {
+  number
+  title
+  body
+  state
+  url
+  headRefName
+  baseRefName
+  additions
+  deletions
+  changedFiles
+  files(first: 100) {
+    ...FileFields
+  }
+}
+"""
+
+_FILE_FIELDS_FRAGMENT = """
+fragment FileFields on PullRequestChangedFileConnection {
+  nodes { path additions deletions changeType }
+  pageInfo { hasNextPage endCursor }
+}
+"""
+
+# Next page of changed files for a PR with more than 100 of them
+_PR_FILES_PAGE_QUERY = """
+query($owner: String!, $name: String!, $number: Int!, $after: String!) {
+  repository(owner: $owner, name: $name) {
+    pullRequest(number: $number) {
+      files(first: 100, after: $after) {
+        ...FileFields
+      }
+    }
+  }
+}
+""" + _FILE_FIELDS_FRAGMENT
+
+# Aliased pullRequest fields per GraphQL request (keeps the query under GitHub's node limits)
+_GRAPHQL_BATCH_SIZE = 50
+
+
+class GitHubService(VCSService):
+    changes_key = "files"
+
     def __init__(self, api_token: str, base_url: str = "https://api.github.com"):
-        self.api_token = api_token
-        self.base_url = base_url.rstrip('/')
-        self.headers = {
-            "Authorization": f"token {api_token}",
-            "Accept": "application/vnd.github.v3+json",
-            "Content-Type": "application/json"
-        }
+        super().__init__(
+            api_token,
+            base_url,
+            {
+                "Authorization": f"token {api_token}",
+                "Accept": "application/vnd.github.v3+json"
+            }
+        )
+        # url -> (etag, parsed body); 304 replies are free against the rate limit
+        self._etag_cache = LRUCache(maxsize=512)
+        # Repository metadata is near-static: serve repeats without a round trip
+        self._repo_info_cache = TTLCache(maxsize=256, ttl=300)
 
-    def create_pull_request_comment(self, owner: str, repo: str, pr_number: int, comment: str) -> Dict[str, Any]:
+    async def create_pull_request_comment(self, owner: str, repo: str, pr_number: int, comment: str) -> Dict[str, Any]:
         """Add a comment to a pull request"""
         url = f"{self.base_url}/repos/{owner}/{repo}/issues/{pr_number}/comments"
 
@@ -21,49 +82,141 @@ class GitHubService:
             "body": comment
         }
 
-        response = requests.post(url, headers=self.headers, json=data)
+        response = await self._post(url, data)
 
         if response.status_code == 201:
             return response.json()
         else:
             raise Exception(f"Failed to create PR comment: {response.text}")
 
-    def get_pull_request_changes(self, owner: str, repo: str, pr_number: int) -> Dict[str, Any]:
+    async def get_pull_request_changes(self, owner: str, repo: str, pr_number: int) -> Dict[str, Any]:
         """Get changes in a pull request"""
-        # Get PR details
         pr_url = f"{self.base_url}/repos/{owner}/{repo}/pulls/{pr_number}"
-        pr_response = requests.get(pr_url, headers=self.headers)
+        files_url = f"{self.base_url}/repos/{owner}/{repo}/pulls/{pr_number}/files"
 
-        if pr_response.status_code != 200:
-            raise Exception(f"Failed to get PR details: {pr_response.text}")
+        # PR details and changed files are independent: fetch them concurrently
+        pr_data, files_data = await asyncio.gather(
+            self._get_with_etag(pr_url, "Failed to get PR details"),
+            self._get_with_etag(files_url, "Failed to get PR files")
+        )
 
-        pr_data = pr_response.json()
+        return {
+            "pull_request": pr_data,
+            "files": files_data
+        }
 
-        # Get files changed in PR
-        files_url = f"{self.base_url}/repos/{owner}/{repo}/pulls/{pr_number}/files"
-        files_response = requests.get(files_url, headers=self.headers)
+    @property
+    def graphql_url(self) -> str:
+        """GraphQL endpoint: api.github.com/graphql, or <host>/api/graphql on GitHub Enterprise"""
+        if self.base_url.endswith("/api/v3"):
+            return f"{self.base_url[:-len('/v3')]}/graphql"
+        return f"{self.base_url}/graphql"
 
-        if files_response.status_code == 200:
-            files_data = files_response.json()
-            return {
-                "pull_request": pr_data,
-                "files": files_data
-            }
-        else:
-            raise Exception(f"Failed to get PR files: {files_response.text}")
+    async def get_pull_requests_batch(self, owner: str, repo: str, numbers: List[int]) -> List[Dict[str, Any]]:
+        """Get several pull requests with their files via GraphQL, one request per 50 PRs
+
+        Numbers that do not resolve to a pull request (missing or inaccessible)
+        are skipped; each result carries its number in pull_request.number.
+        """
+        chunks = [numbers[i:i + _GRAPHQL_BATCH_SIZE] for i in range(0, len(numbers), _GRAPHQL_BATCH_SIZE)]
+        results = await asyncio.gather(*(self._query_pull_requests(owner, repo, chunk) for chunk in chunks))
+        return [changes for chunk_changes in results for changes in chunk_changes]
+
+    async def _query_pull_requests(self, owner: str, repo: str, numbers: List[int]) -> List[Dict[str, Any]]:
+        aliases = "\n".join(
+            f"    pr{i}: pullRequest(number: {int(number)}) {{ ...PRFields }}"
+            for i, number in enumerate(numbers)
+        )
+        query = (
+            "query($owner: String!, $name: String!) {\n"
+            "  repository(owner: $owner, name: $name) {\n"
+            f"{aliases}\n"
+            "  }\n"
+            "}\n"
+            f"{_PR_FIELDS_FRAGMENT}"
+            f"{_FILE_FIELDS_FRAGMENT}"
+        )
 
-    def get_repository_info(self, owner: str, repo: str) -> Dict[str, Any]:
+        data = await self._graphql(query, {"owner": owner, "name": repo}, "Failed to get pull requests")
+        repository = data["repository"]
+
+        # A missing PR comes back as a null alias (with a NOT_FOUND error); skip it instead of failing the batch
+        prs = [pr for pr in (repository.get(f"pr{i}") for i in range(len(numbers))) if pr is not None]
+        await asyncio.gather(*(
+            self._fetch_remaining_files(owner, repo, pr) for pr in prs if pr["files"]["pageInfo"]["hasNextPage"]
+        ))
+        return [self._graphql_pr_to_changes(pr) for pr in prs]
+
+    async def _fetch_remaining_files(self, owner: str, repo: str, pr: Dict[str, Any]) -> None:
+        """Page through the files of a PR with more than 100 of them, appending to pr["files"]["nodes"]"""
+        files = pr["files"]
+        while files["pageInfo"]["hasNextPage"]:
+            data = await self._graphql(
+                _PR_FILES_PAGE_QUERY,
+                {"owner": owner, "name": repo, "number": pr["number"], "after": files["pageInfo"]["endCursor"]},
+                "Failed to get pull request files"
+            )
+            pull_request = data["repository"]["pullRequest"]
+            if pull_request is None:
+                break
+            page = pull_request["files"]
+            files["nodes"].extend(page["nodes"])
+            files["pageInfo"] = page["pageInfo"]
+
+    async def _graphql(self, query: str, variables: Dict[str, Any], error_message: str) -> Dict[str, Any]:
+        """Run a GraphQL query; partial results (e.g. some aliases not found) are returned as is"""
+        response = await self._post(self.graphql_url, {"query": query, "variables": variables})
+
+        if response.status_code != 200:
+            raise Exception(f"{error_message}: {response.text}")
+
+        payload = response.json()
+        data = payload.get("data")
+        if not data or data.get("repository") is None:
+            raise Exception(f"{error_message}: {payload.get('errors')}")
+        return data
+
+    @staticmethod
+    def _graphql_pr_to_changes(pr: Dict[str, Any]) -> Dict[str, Any]:
+        """Map a GraphQL pullRequest node to the REST-shaped get_pull_request_changes result"""
+        return {
+            "pull_request": {
+                "number": pr["number"],
+                "title": pr["title"],
+                "body": pr["body"],
+                "state": "open" if pr["state"] == "OPEN" else "closed",
+                "merged": pr["state"] == "MERGED",
+                "html_url": pr["url"],
+                "head": {"ref": pr["headRefName"]},
+                "base": {"ref": pr["baseRefName"]},
+                "additions": pr["additions"],
+                "deletions": pr["deletions"],
+                "changed_files": pr["changedFiles"]
+            },
+            "files": [
+                {
+                    "filename": node["path"],
+                    "status": _GRAPHQL_FILE_STATUS.get(node["changeType"], node["changeType"].lower()),
+                    "additions": node["additions"],
+                    "deletions": node["deletions"]
+                }
+                for node in pr["files"]["nodes"]
+            ]
+        }
+
+    async def get_repository_info(self, owner: str, repo: str) -> Dict[str, Any]:
         """Get repository information"""
-        url = f"{self.base_url}/repos/{owner}/{repo}"
+        cached = self._repo_info_cache.get((owner, repo))
+        if cached is not None:
+            return cached
 
-        response = requests.get(url, headers=self.headers)
+        url = f"{self.base_url}/repos/{owner}/{repo}"
 
-        if response.status_code == 200:
-            return response.json()
-        else:
-            raise Exception(f"Failed to get repository info: {response.text}")
+        info = await self._get_with_etag(url, "Failed to get repository info")
+        self._repo_info_cache.set((owner, repo), info)
+        return info
 
-    def create_check_run(self, owner: str, repo: str, sha: str, name: str, status: str, conclusion: str = None, output: Dict = None) -> Dict[str, Any]:
+    async def create_check_run(self, owner: str, repo: str, sha: str, name: str, status: str, conclusion: str = None, output: Dict = None) -> Dict[str, Any]:
         """Create a check run (for GitHub Actions integration)"""
         url = f"{self.base_url}/repos/{owner}/{repo}/check-runs"
 
@@ -79,44 +232,30 @@ class GitHubService:
         if output:
             data["output"] = output
 
-        response = requests.post(url, headers=self.headers, json=data)
+        response = await self._post(url, data)
 
         if response.status_code == 201:
             return response.json()
         else:
             raise Exception(f"Failed to create check run: {response.text}")
 
-    def analyze_code_changes(self, changes: Dict[str, Any]) -> str:
-        """Analyze code changes and suggest test impacts"""
-        analysis = "## Анализ изменений кода\n\n"
-
-        if 'files' in changes:
-            test_impacts = []
-            for file in changes['files']:
-                file_path = file.get('filename', '')
-                if self._is_test_related_file(file_path):
-                    test_impacts.append(f"🔍 Изменен тестовый файл: `{file_path}`")
-                elif self._is_source_file(file_path):
-                    test_impacts.append(f"⚠️ Изменен исходный файл: `{file_path}` - требуется проверка тестов")
-
-            if test_impacts:
-                analysis += "### Возможное влияние на тесты:\n"
-                analysis += "\n".join(f"- {impact}" for impact in test_impacts)
-                analysis += "\n\nРекомендуется выполнить полный набор автотестов."
-            else:
-                analysis += "Не обнаружено критических изменений, требующих обновления тестов."
-
-        return analysis
-
-    def _is_test_related_file(self, file_path: str) -> bool:
-        """Check if file is test-related"""
-        test_patterns = [
-            'test', 'spec', 'spec.js', 'test.js', 'test.ts', 'spec.ts',
-            'tests/', 'specs/', '__tests__/', 'test_'
-        ]
-        return any(pattern in file_path.lower() for pattern in test_patterns)
-
-    def _is_source_file(self, file_path: str) -> bool:
-        """Check if file is source code"""
-        source_extensions = ['.js', '.ts', '.jsx', '.tsx', '.py', '.java', '.cs', '.php', '.rb', '.go', '.rs', '.cpp', '.c']
-        return any(file_path.lower().endswith(ext) for ext in source_extensions)
\ No newline at end of file
+    async def _get_with_etag(self, url: str, error_message: str) -> Any:
+        """GET a JSON resource, revalidating the cached copy with If-None-Match"""
+        cached = self._etag_cache.get(url)
+        headers = {"If-None-Match": cached[0]} if cached else None
+
+        response = await self._get(url, headers=headers)
+
+        if response.status_code == 304 and cached:
+            return cached[1]
+        if response.status_code != 200:
+            raise Exception(f"{error_message}: {response.text}")
+
+        data = response.json()
+        etag = response.headers.get("ETag")
+        if etag:
+            self._etag_cache.set(url, (etag, data))
+        return data
+
+    def _change_path(self, change: Dict[str, Any]) -> str:
+        return change.get('filename', '')
\ No newline at end of file
@@ -1,9 +1,25 @@
-from typing import Optional, List
+from typing import AsyncIterator, Optional, List, Dict
+import asyncio
+import hashlib
 from .openai_provider import OpenAIProvider
 from .anthropic_provider import AnthropicProvider
 from .openrouter_provider import OpenRouterProvider
 
 
+_PROVIDERS = {
+    "openai": OpenAIProvider,
+    "anthropic": AnthropicProvider,
+    "openrouter": OpenRouterProvider,
+}
+
+# Provider calls in flight per generate_batch
+_BATCH_CONCURRENCY = 32
+
+# Generations currently in flight, keyed by request fingerprint.
+# Concurrent identical requests await the same provider call instead of issuing their own.
+_inflight: Dict[str, "asyncio.Task[str]"] = {}
+
+
 class LLMService:
     def __init__(self, provider: str, api_key: Optional[str], model: str):
         self.provider = provider
@@ -12,20 +28,16 @@ class LLMService:
         self.client = self._get_provider()
 
     def _get_provider(self):
-        if self.provider == "openai":
-            if not self.api_key:
-                raise ValueError("API key is required for OpenAI provider")
-            return OpenAIProvider(self.api_key, self.model)
-        elif self.provider == "anthropic":
-            if not self.api_key:
-                raise ValueError("API key is required for Anthropic provider")
-            return AnthropicProvider(self.api_key, self.model)
-        elif self.provider == "openrouter":
-            if not self.api_key:
-                raise ValueError("API key is required for OpenRouter provider")
-            return OpenRouterProvider(self.api_key, self.model)
-        else:
-            raise ValueError(f"Unsupported provider: {self.provider}. Supported: openai, anthropic, openrouter")
+        provider_cls = _PROVIDERS.get(self.provider)
+        if provider_cls is None:
+            raise ValueError(f"Unsupported provider: {self.provider}. Supported: {', '.join(_PROVIDERS)}")
+        if not self.api_key:
+            raise ValueError(f"API key is required for {self.provider} provider")
+        return provider_cls(self.api_key, self.model)
+
+    async def aclose(self) -> None:
+        """Release the provider's HTTP connections"""
+        await self.client.aclose()
 
     async def generate(
         self,
@@ -33,4 +45,62 @@ class LLMService:
         images: Optional[List[bytes]] = None,
         max_tokens: int = 4000
     ) -> str:
-        return await self.client.generate(prompt, images, max_tokens)
\ No newline at end of file
+        key = self._request_key(prompt, images, max_tokens)
+        task = _inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self.client.generate(prompt, images, max_tokens))
+            _inflight[key] = task
+            task.add_done_callback(lambda t: self._release(key, t))
+        # shield: a cancelled caller must not cancel the call other waiters share
+        return await asyncio.shield(task)
+
+    async def generate_batch(
+        self,
+        prompts: List[str],
+        images_per_prompt: Optional[List[Optional[List[bytes]]]] = None,
+        max_tokens: int = 4000
+    ) -> List[str]:
+        """Generate completions for many prompts concurrently, results in prompt order"""
+        if images_per_prompt is None:
+            images_per_prompt = [None] * len(prompts)
+        elif len(images_per_prompt) != len(prompts):
+            raise ValueError(
+                f"images_per_prompt has {len(images_per_prompt)} entries for {len(prompts)} prompts"
+            )
+        semaphore = asyncio.Semaphore(_BATCH_CONCURRENCY)
+
+        async def generate_one(prompt: str, images: Optional[List[bytes]]) -> str:
+            async with semaphore:
+                return await self.generate(prompt, images, max_tokens)
+
+        return await asyncio.gather(*(
+            generate_one(prompt, images) for prompt, images in zip(prompts, images_per_prompt, strict=True)
+        ))
+
+    async def generate_stream(
+        self,
+        prompt: str,
+        images: Optional[List[bytes]] = None,
+        max_tokens: int = 4000
+    ) -> AsyncIterator[str]:
+        """Yield the completion as text chunks as the provider produces them"""
+        async for chunk in self.client.generate_stream(prompt, images, max_tokens):
+            yield chunk
+
+    def _request_key(self, prompt: str, images: Optional[List[bytes]], max_tokens: int) -> str:
+        """Fingerprint of a generation request (the API key goes in hashed, never stored)"""
+        digest = hashlib.blake2b(digest_size=32)
+        for part in (self.provider, self.api_key or "", self.model, str(max_tokens), prompt):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        for image in images or []:
+            digest.update(hashlib.blake2b(image, digest_size=32).digest())
+        return digest.hexdigest()
+
+    @staticmethod
+    def _release(key: str, task: "asyncio.Task[str]") -> None:
+        if _inflight.get(key) is task:
+            del _inflight[key]
+        if not task.cancelled():
+            # Mark the exception as retrieved even if every waiter went away
+            task.exception()
@@ -1,40 +1,52 @@
-from openai import OpenAI
-from typing import List, Optional
-import base64
+from openai import AsyncOpenAI
+import httpx
+from typing import AsyncIterator, List, Optional
+from ..utils.image_utils import build_chat_messages
 
 
 class OpenAIProvider:
     def __init__(self, api_key: str, model: str = "gpt-4"):
-        self.client = OpenAI(api_key=api_key)
+        self.client = AsyncOpenAI(
+            api_key=api_key,
+            max_retries=2,
+            timeout=httpx.Timeout(300.0, connect=10.0)
+        )
         self.model = model
 
+    async def aclose(self) -> None:
+        await self.client.close()
+
     async def generate(
         self,
         prompt: str,
         images: Optional[List[bytes]] = None,
         max_tokens: int = 4000
     ) -> str:
-        messages = []
-        
-        if images:
-            content = [{"type": "text", "text": prompt}]
-            for image in images:
-                base64_image = base64.b64encode(image).decode('utf-8')
-                content.append({
-                    "type": "image_url",
-                    "image_url": {
-                        "url": f"data:image/png;base64,{base64_image}"
-                    }
-                })
-            messages.append({"role": "user", "content": content})
-        else:
-            messages.append({"role": "user", "content": prompt})
-
-        response = self.client.chat.completions.create(
+        messages = await build_chat_messages(prompt, images)
+
+        response = await self.client.chat.completions.create(
             model=self.model,
             messages=messages,
             max_tokens=max_tokens,
             temperature=0.7
         )
 
-        return response.choices[0].message.content
\ No newline at end of file
+        return response.choices[0].message.content
+
+    async def generate_stream(
+        self,
+        prompt: str,
+        images: Optional[List[bytes]] = None,
+        max_tokens: int = 4000
+    ) -> AsyncIterator[str]:
+        stream = await self.client.chat.completions.create(
+            model=self.model,
+            messages=await build_chat_messages(prompt, images),
+            max_tokens=max_tokens,
+            temperature=0.7,
+            stream=True
+        )
+
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
@@ -1,6 +1,7 @@
 import httpx
-from typing import List, Optional
-import base64
+import orjson
+from typing import AsyncIterator, List, Optional
+from ..utils.image_utils import build_chat_messages
 
 
 class OpenRouterProvider:
@@ -8,6 +9,20 @@ class OpenRouterProvider:
         self.api_key = api_key
         self.model = model
         self.base_url = "https://openrouter.ai/api/v1"
+        # Shared client: the TLS handshake is paid once, not per generation
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            http2=True,
+            headers={
+                "Authorization": f"Bearer {api_key}",
+                "Content-Type": "application/json"
+            },
+            timeout=httpx.Timeout(300.0, connect=10.0),
+            limits=httpx.Limits(max_keepalive_connections=10, max_connections=20)
+        )
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
 
     async def generate(
         self,
@@ -15,26 +30,7 @@ class OpenRouterProvider:
         images: Optional[List[bytes]] = None,
         max_tokens: int = 4000
     ) -> str:
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-
-        messages = []
-        
-        if images:
-            content = [{"type": "text", "text": prompt}]
-            for image in images:
-                base64_image = base64.b64encode(image).decode('utf-8')
-                content.append({
-                    "type": "image_url",
-                    "image_url": {
-                        "url": f"data:image/png;base64,{base64_image}"
-                    }
-                })
-            messages.append({"role": "user", "content": content})
-        else:
-            messages.append({"role": "user", "content": prompt})
+        messages = await build_chat_messages(prompt, images)
 
         payload = {
             "model": self.model,
@@ -43,14 +39,44 @@ class OpenRouterProvider:
             "temperature": 0.7
         }
 
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.base_url}/chat/completions",
-                headers=headers,
-                json=payload,
-                timeout=300.0
-            )
-            response.raise_for_status()
-            result = response.json()
-
-        return result["choices"][0]["message"]["content"]
\ No newline at end of file
+        response = await self.client.post("/chat/completions", json=payload)
+        response.raise_for_status()
+        result = response.json()
+
+        return result["choices"][0]["message"]["content"]
+
+    async def generate_stream(
+        self,
+        prompt: str,
+        images: Optional[List[bytes]] = None,
+        max_tokens: int = 4000
+    ) -> AsyncIterator[str]:
+        payload = {
+            "model": self.model,
+            "messages": await build_chat_messages(prompt, images),
+            "max_tokens": max_tokens,
+            "temperature": 0.7,
+            "stream": True
+        }
+
+        async with self.client.stream("POST", "/chat/completions", json=payload) as response:
+            if response.is_error:
+                await response.aread()
+                response.raise_for_status()
+
+            # Server-sent events: "data: {...}" frames, ": ..." keep-alive comments, "data: [DONE]" at the end
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+
+                event = orjson.loads(data)
+                if "error" in event:
+                    raise Exception(f"OpenRouter stream error: {event['error']}")
+                choices = event.get("choices")
+                if choices:
+                    text = choices[0].get("delta", {}).get("content")
+                    if text:
+                        yield text
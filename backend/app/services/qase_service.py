@@ -1,7 +1,17 @@
-import requests
-from typing import List, Dict, Any, Optional
+import orjson
+from typing import List, Dict, Any, Optional, Tuple
 import json
 from ..models.schemas import TestCase
+from ..utils.http_retry import make_client
+
+
+# priority -> (Qase severity, Qase priority)
+_PRIORITY_MAP = {
+    "high": (4, 4),
+    "medium": (3, 3),
+    "low": (2, 2),
+}
+_DEFAULT_PRIORITY = (3, 3)
 
 
 class QaseService:
@@ -13,51 +23,51 @@ class QaseService:
             "Token": api_token,
             "Content-Type": "application/json"
         }
+        self.client = make_client(self.headers)
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+    async def __aenter__(self) -> "QaseService":
+        return self
 
-    def create_test_case(self, test_case: TestCase) -> Dict[str, Any]:
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    async def create_test_case(self, test_case: TestCase) -> Dict[str, Any]:
         """Create a test case in Qase"""
         url = f"{self.base_url}/case/{self.project_code}"
 
-        # Convert TestCase to Qase format
-        qase_case = {
-            "title": test_case.title,
-            "description": test_case.description,
-            "preconditions": "",
-            "postconditions": test_case.expected_result,
-            "severity": self._map_priority_to_severity(test_case.priority),
-            "priority": self._map_priority_to_qase_priority(test_case.priority),
-            "type": "functional",
-            "layer": "e2e",
-            "is_flaky": 0,
-            "behavior": "positive",
-            "automation": "automated",
-            "status": "actual",
-            "steps": [
-                {
-                    "hash": f"step_{i+1}",
-                    "position": i + 1,
-                    "action": step.action,
-                    "expected_result": step.expected,
-                    "attachments": []
-                }
-                for i, step in enumerate(test_case.steps)
-            ],
-            "attachments": []
-        }
+        qase_case = self._to_qase_case(test_case)
 
-        response = requests.post(url, headers=self.headers, json=qase_case)
+        response = await self.client.post(url, content=orjson.dumps(qase_case))
 
         if response.status_code == 200:
             return response.json()
         else:
             raise Exception(f"Failed to create test case: {response.text}")
 
-    def get_test_cases(self, limit: int = 100) -> List[Dict[str, Any]]:
+    async def create_test_cases_bulk(self, test_cases: List[TestCase]) -> List[Dict[str, Any]]:
+        """Create many test cases in Qase with a single bulk request"""
+        if not test_cases:
+            return []
+
+        url = f"{self.base_url}/case/{self.project_code}/bulk"
+
+        response = await self.client.post(url, content=orjson.dumps({"cases": [self._to_qase_case(tc) for tc in test_cases]}))
+
+        if response.status_code == 200:
+            return [{"id": case_id} for case_id in response.json()["result"]["ids"]]
+        else:
+            # No per-case fallback on 404: Qase also answers 404 for an unknown project code
+            raise Exception(f"Failed to create test cases: {response.text}")
+
+    async def get_test_cases(self, limit: int = 100) -> List[Dict[str, Any]]:
         """Get test cases from Qase"""
         url = f"{self.base_url}/case/{self.project_code}"
         params = {"limit": limit}
 
-        response = requests.get(url, headers=self.headers, params=params)
+        response = await self.client.get(url, params=params)
 
         if response.status_code == 200:
             data = response.json()
@@ -65,17 +75,18 @@ class QaseService:
         else:
             raise Exception(f"Failed to get test cases: {response.text}")
 
-    def update_test_case(self, case_id: int, test_case: TestCase) -> Dict[str, Any]:
+    async def update_test_case(self, case_id: int, test_case: TestCase) -> Dict[str, Any]:
         """Update an existing test case in Qase"""
         url = f"{self.base_url}/case/{self.project_code}/{case_id}"
 
+        severity, priority = self._map_priority(test_case.priority)
         qase_case = {
             "title": test_case.title,
             "description": test_case.description,
             "preconditions": "",
-            "postconditions": test_case.expected_result,
-            "severity": self._map_priority_to_severity(test_case.priority),
-            "priority": self._map_priority_to_qase_priority(test_case.priority),
+            "postconditions": test_case.expectedResult,
+            "severity": severity,
+            "priority": priority,
             "steps": [
                 {
                     "hash": f"step_{i+1}",
@@ -88,14 +99,14 @@ class QaseService:
             ]
         }
 
-        response = requests.patch(url, headers=self.headers, json=qase_case)
+        response = await self.client.patch(url, content=orjson.dumps(qase_case))
 
         if response.status_code == 200:
             return response.json()
         else:
             raise Exception(f"Failed to update test case: {response.text}")
 
-    def create_test_run(self, title: str, cases: List[int] = None) -> Dict[str, Any]:
+    async def create_test_run(self, title: str, cases: List[int] = None) -> Dict[str, Any]:
         """Create a test run in Qase"""
         url = f"{self.base_url}/run/{self.project_code}"
 
@@ -106,18 +117,18 @@ class QaseService:
             "is_automated": True
         }
 
-        response = requests.post(url, headers=self.headers, json=run_data)
+        response = await self.client.post(url, content=orjson.dumps(run_data))
 
         if response.status_code == 200:
             return response.json()
         else:
             raise Exception(f"Failed to create test run: {response.text}")
 
-    def get_projects(self) -> List[Dict[str, Any]]:
+    async def get_projects(self) -> List[Dict[str, Any]]:
         """Get all projects"""
         url = f"{self.base_url}/project"
 
-        response = requests.get(url, headers=self.headers)
+        response = await self.client.get(url)
 
         if response.status_code == 200:
             data = response.json()
@@ -125,20 +136,35 @@ class QaseService:
         else:
             raise Exception(f"Failed to get projects: {response.text}")
 
-    def _map_priority_to_severity(self, priority: str) -> int:
-        """Map priority to Qase severity (1-5)"""
-        mapping = {
-            "high": 4,
-            "medium": 3,
-            "low": 2
-        }
-        return mapping.get(priority.lower(), 3)
-
-    def _map_priority_to_qase_priority(self, priority: str) -> int:
-        """Map priority to Qase priority (1-4)"""
-        mapping = {
-            "high": 4,
-            "medium": 3,
-            "low": 2
+    def _to_qase_case(self, test_case: TestCase) -> Dict[str, Any]:
+        """Convert TestCase to Qase format"""
+        severity, priority = self._map_priority(test_case.priority)
+        return {
+            "title": test_case.title,
+            "description": test_case.description,
+            "preconditions": "",
+            "postconditions": test_case.expectedResult,
+            "severity": severity,
+            "priority": priority,
+            "type": "functional",
+            "layer": "e2e",
+            "is_flaky": 0,
+            "behavior": "positive",
+            "automation": "automated",
+            "status": "actual",
+            "steps": [
+                {
+                    "hash": f"step_{i+1}",
+                    "position": i + 1,
+                    "action": step.action,
+                    "expected_result": step.expected,
+                    "attachments": []
+                }
+                for i, step in enumerate(test_case.steps)
+            ],
+            "attachments": []
         }
-        return mapping.get(priority.lower(), 3)
\ No newline at end of file
+
+    def _map_priority(self, priority: str) -> Tuple[int, int]:
+        """Map priority to Qase (severity 1-5, priority 1-4)"""
+        return _PRIORITY_MAP.get(priority.lower() if priority else "", _DEFAULT_PRIORITY)
\ No newline at end of file
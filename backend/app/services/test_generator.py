@@ -1,34 +1,37 @@
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 import json
 import re
+import orjson
+import hashlib
 import logging
+from config.settings import settings
 from .llm_service import LLMService
-from ..models.schemas import TestCase, TestStep, GenerateResponse
+from ..models.schemas import TestCase, TestStep, GenerateResponse, PriorityEnum
+from ..utils.cache import TTLCache
+from ..utils.json_repair import escape_string_control_chars
 
 logger = logging.getLogger(__name__)
 
+# Parsed responses for repeated prompts (same provider, model, text and screenshots)
+_response_cache = TTLCache(maxsize=256, ttl=settings.cache_ttl)
 
-class TestGenerator:
-    def __init__(self, llm_service: LLMService):
-        self.llm_service = llm_service
-
-    def build_prompt(
-        self,
-        description: Optional[str],
-        source_code: Optional[Dict[str, Any]]
-    ) -> str:
-        prompt = """You are a manual QA tester who tests frontend web applications by clicking buttons, filling forms, and checking what appears on screen. You don't need to understand backend code or technical details - just focus on what users see and do.
+# Паттерны ремонта JSON компилируются один раз при импорте
+_TRAILING_COMMA = re.compile(r',(\s*[}\]])')
+_MISSING_COMMA_OBJ = re.compile(r'}(\s*)"([^"]+)":')
+_MISSING_COMMA_ARR = re.compile(r'](\s*)"([^"]+)":')
+_TEST_CASES_BLOCK = re.compile(r'"test_cases"\s*:\s*\[[\s\S]*?\]', re.IGNORECASE)
+_JSON_DECODER = json.JSONDecoder()
+# Приоритет, если модель его не указала
+_DEFAULT_PRIORITY = PriorityEnum.medium
 
-"""
 
-        if description:
-            prompt += f"**What the feature does (from user's perspective):**\n{description}\n\n"
+class TestGenerator:
+    # Static prompt template; build_prompt only inserts the variable fragments
+    _PROMPT_HEAD = """You are a manual QA tester who tests frontend web applications by clicking buttons, filling forms, and checking what appears on screen. You don't need to understand backend code or technical details - just focus on what users see and do.
 
-        # Skip source code entirely for manual QA - they don't need technical details
-        if source_code:
-            prompt += "**Note:** Ignore any technical code information provided - focus only on user interface testing.\n\n"
+"""
 
-        prompt += f"""
+    _PROMPT_TAIL = """
 Create simple test cases that test what users actually do:
 - Click buttons and links
 - Type text into fields
@@ -40,25 +43,25 @@ Keep test cases simple and focused on user actions. Avoid any backend or technic
 
 IMPORTANT: Return ONLY raw JSON (no markdown formatting, no code blocks, no additional text):
 
-{{
+{
   "test_cases": [
-    {{
+    {
       "id": "TC001",
       "title": "Test case title",
       "description": "Simple description of what to test",
       "steps": [
-        {{
+        {
           "step": 1,
           "action": "What the tester should do",
           "expected": "What should happen on screen"
-        }}
+        }
       ],
       "expected_result": "Overall result",
       "priority": "high"
-    }}
+    }
   ],
   "markdown": "# Test Cases\\n\\n## TC001: Test Title\\nDetails..."
-}}
+}
 
 JSON VALIDATION REQUIREMENTS:
 - All property values must be properly quoted
@@ -76,7 +79,27 @@ Make sure to:
 - Make the markdown simple and readable
 """
 
-        return prompt
+    def __init__(self, llm_service: LLMService):
+        self.llm_service = llm_service
+
+    def build_prompt(
+        self,
+        description: Optional[str],
+        source_code: Optional[Dict[str, Any]]
+    ) -> str:
+        # Неизменные части шаблона живут в классе; склеиваем один раз
+        parts = [self._PROMPT_HEAD]
+
+        if description:
+            parts.append(f"**What the feature does (from user's perspective):**\n{description}\n\n")
+
+        # Skip source code entirely for manual QA - they don't need technical details
+        if source_code:
+            parts.append("**Note:** Ignore any technical code information provided - focus only on user interface testing.\n\n")
+
+        parts.append(self._PROMPT_TAIL)
+
+        return "".join(parts)
 
     async def generate(
         self,
@@ -86,78 +109,125 @@ Make sure to:
     ) -> GenerateResponse:
         prompt = self.build_prompt(description, source_code)
 
+        cache_key = self._cache_key(prompt, images)
+        cached = _response_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
         response_text = await self.llm_service.generate(
             prompt=prompt,
             images=images,
             max_tokens=4000
         )
 
-        return self.parse_response(response_text)
+        response = self._parse_json_response(response_text)
+        if response is None:
+            # Fallback-ответы не кэшируем: следующий запрос получит шанс на нормальный ответ модели
+            logger.warning("No valid JSON found in response, using fallback")
+            return self.generate_fallback_response(response_text)
+
+        _response_cache.set(cache_key, response)
+        return response
+
+    def _cache_key(self, prompt: str, images: Optional[List[bytes]]) -> str:
+        """Fingerprint of provider, credential, model, prompt and screenshots
+
+        The API key goes in hashed (never stored), so a cached response is only
+        served to callers using the key that paid for it.
+        """
+        digest = hashlib.blake2b(digest_size=32)
+        for part in (self.llm_service.provider, self.llm_service.api_key or "", self.llm_service.model, prompt):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        for image in images or []:
+            digest.update(hashlib.blake2b(image, digest_size=32).digest())
+        return digest.hexdigest()
 
     def parse_response(self, response_text: str) -> GenerateResponse:
-        # Используем более точный поиск JSON объектов
-        json_patterns = [
-            r'```json\s*(\{[\s\S]*?"test_cases"[\s\S]*?\})\s*```',  # JSON в markdown блоке с test_cases
-            r'```\s*(\{[\s\S]*?"test_cases"[\s\S]*?\})\s*```',     # JSON в code блоке с test_cases
-            r'(\{[\s\S]*?"test_cases"[\s\S]*?\})',  # JSON с test_cases без markdown
-            r'(\{[\s\S]*?\})'  # Любой JSON объект (запасной вариант)
-        ]
-        
-        for pattern in json_patterns:
-            json_match = re.search(pattern, response_text, re.DOTALL)
-            if json_match:
-                try:
-                    json_str = json_match.group(1) if json_match.groups() else json_match.group()
-
-                    # Сначала пробуем парсить как есть
-                    try:
-                        data = json.loads(json_str)
-                    except json.JSONDecodeError:
-                        # Если не получилось, пытаемся исправить
-                        json_str = self._fix_json_string(json_str)
-                        data = json.loads(json_str)
-                    
-                    # Проверяем обязательные поля
-                    if "test_cases" not in data:
-                        continue
-                    
-                    test_cases = []
-                    for tc_data in data.get("test_cases", []):
-                        try:
-                            steps = []
-                            for step_data in tc_data.get("steps", []):
-                                step = TestStep(
-                                    step=step_data.get("step", 1),
-                                    action=step_data.get("action", ""),
-                                    expected=step_data.get("expected", "")
-                                )
-                                steps.append(step)
-                            
-                            test_case = TestCase(
-                                id=tc_data.get("id", f"TC{len(test_cases)+1:03d}"),
-                                title=tc_data.get("title", "Generated Test Case"),
-                                description=tc_data.get("description", ""),
-                                steps=steps,
-                                expected_result=tc_data.get("expected_result", ""),
-                                priority=tc_data.get("priority", "medium")
-                            )
-                            test_cases.append(test_case)
-                        except (KeyError, TypeError, ValueError) as e:
-                            logger.warning(f"Error parsing test case: {e}, data: {tc_data}")
-                            continue
-
-                    markdown = data.get("markdown", self.generate_default_markdown(test_cases))
-
-                    return GenerateResponse(
-                        test_cases=test_cases,
-                        markdown=markdown
-                    )
-                except (json.JSONDecodeError, TypeError, ValueError) as e:
-                    logger.warning(f"JSON parsing failed: {e}, json_str: {json_str[:500]}...")
-                    continue
-
-        logger.warning("No valid JSON found in response, using fallback")
-        return self.generate_fallback_response(response_text)
+        response = self._parse_json_response(response_text)
+        if response is None:
+            logger.warning("No valid JSON found in response, using fallback")
+            return self.generate_fallback_response(response_text)
+        return response
+
+    def _parse_json_response(self, response_text: str) -> Optional[GenerateResponse]:
+        text = response_text.strip()
+
+        # 1. Ответ целиком является JSON (просим модель именно об этом)
+        data = self._try_load(text)
+
+        # 2. JSON-объект с "test_cases" внутри текста, в том числе в ```json ... ``` блоке
+        #    (один проход C-декодера по тексту, без regex и отдельной обработки ограждения)
+        if data is None:
+            candidates = self._extract_json_candidates(text)
+            if candidates and self._has_test_cases(candidates[0][1]):
+                data = candidates[0][1]
+
+        # 3. Валидного объекта нет (сломанный или обрезанный JSON) - ремонтируем текст целиком
+        if data is None and '"test_cases"' in text:
+            data = self._load_repaired(text)
+
+        if data is not None:
+            return self._build_response(data)
+        return None
+
+    def _try_load(self, json_str: str) -> Optional[Dict[str, Any]]:
+        """Парсит JSON-объект с test_cases или возвращает None"""
+        # Быстрый путь через orjson; ремонт и поиск кандидатов остаются на stdlib json (raw_decode)
+        try:
+            data = orjson.loads(json_str)
+        except orjson.JSONDecodeError:
+            return None
+        return data if self._has_test_cases(data) else None
+
+    def _load_repaired(self, json_str: str) -> Optional[Dict[str, Any]]:
+        try:
+            data = self._load_repaired_json(json_str)
+        except json.JSONDecodeError:
+            data = None
+        if not self._has_test_cases(data):
+            logger.warning(f"JSON parsing failed, json_str: {json_str[:500]}...")
+            return None
+        return data
+
+    @staticmethod
+    def _has_test_cases(data: Any) -> bool:
+        # null, строка или объект вместо списка не годятся: такой ответ уходит в fallback
+        return isinstance(data, dict) and isinstance(data.get("test_cases"), list)
+
+    def _build_response(self, data: Dict[str, Any]) -> GenerateResponse:
+        test_cases = []
+        for tc_data in data.get("test_cases", []):
+            try:
+                # Модель валидируется одним вызовом (вложенные шаги тоже) в ядре pydantic,
+                # без отдельного конструктора на каждый шаг. Вывод LLM не доверенный, поэтому
+                # model_construct без проверки типов здесь не подходит
+                test_case = TestCase.model_validate({
+                    "id": tc_data.get("id", f"TC{len(test_cases)+1:03d}"),
+                    "title": tc_data.get("title", "Generated Test Case"),
+                    "description": tc_data.get("description", ""),
+                    "steps": [
+                        {
+                            "step": step_data.get("step", 1),
+                            "action": step_data.get("action", ""),
+                            "expected": step_data.get("expected", "")
+                        }
+                        for step_data in tc_data.get("steps", [])
+                    ],
+                    "expected_result": tc_data.get("expected_result", ""),
+                    "priority": tc_data.get("priority", _DEFAULT_PRIORITY)
+                })
+                test_cases.append(test_case)
+            except (KeyError, TypeError, ValueError, AttributeError) as e:
+                logger.warning(f"Error parsing test case: {e}, data: {tc_data}")
+                continue
+
+        markdown = data.get("markdown") or self.generate_default_markdown(test_cases)
+
+        return GenerateResponse(
+            test_cases=test_cases,
+            markdown=markdown
+        )
 
     def generate_fallback_response(self, response_text: str) -> GenerateResponse:
         test_case = TestCase(
@@ -172,7 +242,7 @@ Make sure to:
                 )
             ],
             expected_result="Test execution completes successfully",
-            priority="medium"
+            priority=_DEFAULT_PRIORITY
         )
 
         markdown = self.generate_default_markdown([test_case])
@@ -183,57 +253,48 @@ Make sure to:
         )
 
     def generate_default_markdown(self, test_cases: List[TestCase]) -> str:
-        markdown = "# Test Cases\n\n"
-        
-        for i, tc in enumerate(test_cases, 1):
-            markdown += f"## {i}. {tc.title}\n\n"
-            markdown += f"**ID:** {tc.id}\n\n"
-            markdown += f"**Priority:** {tc.priority.upper()}\n\n"
-            markdown += f"**Description:**\n{tc.description}\n\n"
-            markdown += "### Steps:\n\n"
-            
-            for step in tc.steps:
-                markdown += f"{step.step}. **{step.action}**\n"
-                markdown += f"   - *Expected:* {step.expected}\n\n"
-            
-            markdown += f"### Expected Result:\n{tc.expected_result}\n\n"
-            markdown += "---\n\n"
-
-        return markdown
-
-    def _fix_json_string(self, json_str: str) -> str:
-        """Агрессивный JSON repair"""
-        import re
+        parts = ["# Test Cases\n\n"]
 
+        for i, tc in enumerate(test_cases, 1):
+            parts.append(
+                f"## {i}. {tc.title}\n\n"
+                f"**ID:** {tc.id}\n\n"
+                f"**Priority:** {tc.priority.upper()}\n\n"
+                f"**Description:**\n{tc.description}\n\n"
+                "### Steps:\n\n"
+            )
+
+            parts.extend(
+                f"{step.step}. **{step.action}**\n"
+                f"   - *Expected:* {step.expected}\n\n"
+                for step in tc.steps
+            )
+
+            parts.append(f"### Expected Result:\n{tc.expectedResult}\n\n---\n\n")
+
+        return "".join(parts)
+
+    def _load_repaired_json(self, json_str: str) -> Any:
+        """Агрессивный JSON repair; возвращает уже разобранные данные, без повторного json.loads"""
         # Сначала пробуем простой repair
-        repaired = self._simple_json_repair(json_str)
         try:
-            import json
-            json.loads(repaired)
-            return repaired
-        except:
+            return json.loads(self._simple_json_repair(json_str))
+        except json.JSONDecodeError:
             pass
 
-        # Если не получилось, пробуем извлечь все возможные JSON кандидаты
+        # Если не получилось, берем самый длинный валидный JSON объект из текста (он уже разобран)
         candidates = self._extract_json_candidates(json_str)
-        for candidate in candidates:
-            try:
-                import json
-                json.loads(candidate)
-                return candidate
-            except:
-                continue
+        if candidates:
+            return candidates[0][1]
 
         # Если ничего не помогло, пробуем экстремальный fallback
-        return self._extreme_json_fallback(json_str)
+        return json.loads(self._extreme_json_fallback(json_str))
 
     def _extreme_json_fallback(self, json_str: str) -> str:
         """Экстремальный fallback для очень сломанного JSON"""
-        import re
-
         # Пытаемся найти хотя бы основные структуры
         # Ищем "test_cases": [ ... ]
-        test_cases_match = re.search(r'"test_cases"\s*:\s*\[[\s\S]*?\]', json_str, re.IGNORECASE)
+        test_cases_match = _TEST_CASES_BLOCK.search(json_str)
         if test_cases_match:
             # Создаем минимальный валидный JSON
             return f'{{"test_cases": {test_cases_match.group(0)}}}'
@@ -243,8 +304,6 @@ Make sure to:
 
     def _simple_json_repair(self, json_str: str) -> str:
         """Простой JSON repair"""
-        import re
-
         # Удаляем лишние пробелы
         json_str = json_str.strip()
 
@@ -255,40 +314,11 @@ Make sure to:
         if start_brace != -1 and last_brace != -1 and last_brace > start_brace:
             json_str = json_str[start_brace:last_brace + 1]
 
-        # Исправляем проблемы внутри строк
-        in_string = False
-        escape_next = False
-        result = []
-
-        for char in json_str:
-            if escape_next:
-                result.append(char)
-                escape_next = False
-                continue
-
-            if char == '\\':
-                escape_next = True
-                result.append(char)
-                continue
-
-            if char == '"' and not escape_next:
-                in_string = not in_string
-                result.append(char)
-                continue
-
-            if in_string and char == '\n':
-                result.append('\\n')
-            elif in_string and char == '\t':
-                result.append(' ')
-            elif in_string and char == '\r':
-                continue
-            else:
-                result.append(char)
-
-        json_str = ''.join(result)
+        # Исправляем проблемы внутри строк: строковые литералы находит одна регулярка, без посимвольного цикла
+        json_str = escape_string_control_chars(json_str)
 
         # Удаляем висячие запятые
-        json_str = re.sub(r',(\s*[}\]])', r'\1', json_str)
+        json_str = _TRAILING_COMMA.sub(r'\1', json_str)
 
         # Исправляем незавершенные кавычки
         quote_count = json_str.count('"')
@@ -296,44 +326,25 @@ Make sure to:
             json_str += '"'
 
         # Исправляем отсутствующие запятые между свойствами
-        json_str = re.sub(r'}(\s*)"([^"]+)":', r'},$1"$2":', json_str)
-        json_str = re.sub(r'](\s*)"([^"]+)":', r'],$1"$2":', json_str)
+        json_str = _MISSING_COMMA_OBJ.sub(r'},\1"\2":', json_str)
+        json_str = _MISSING_COMMA_ARR.sub(r'],\1"\2":', json_str)
 
         return json_str
 
-    def _extract_json_candidates(self, json_str: str) -> list:
-        """Извлекает все возможные JSON кандидаты"""
+    def _extract_json_candidates(self, json_str: str) -> List[Tuple[str, Any]]:
+        """Извлекает все валидные JSON объекты вместе с разобранными значениями"""
         candidates = []
 
-        # Ищем все возможные JSON объекты
-        brace_count = 0
-        start_pos = -1
-        in_string = False
-        escape_next = False
-
-        for i, char in enumerate(json_str):
-            if escape_next:
-                escape_next = False
-                continue
-
-            if char == '\\':
-                escape_next = True
-                continue
-
-            if char == '"' and not escape_next:
-                in_string = not in_string
+        # raw_decode разбирает объект от позиции "{" и сообщает, где он закончился
+        pos = json_str.find('{')
+        while pos != -1:
+            try:
+                data, end = _JSON_DECODER.raw_decode(json_str, pos)
+            except json.JSONDecodeError:
+                pos = json_str.find('{', pos + 1)
                 continue
+            candidates.append((json_str[pos:end], data))
+            pos = json_str.find('{', end)
 
-            if not in_string:
-                if char == '{':
-                    if brace_count == 0:
-                        start_pos = i
-                    brace_count += 1
-                elif char == '}':
-                    brace_count -= 1
-                    if brace_count == 0 and start_pos != -1:
-                        candidate = json_str[start_pos:i + 1]
-                        candidates.append(candidate)
-
-        # Сортируем по длине, самые длинные первыми
-        return sorted(candidates, key=len, reverse=True)
\ No newline at end of file
+        # Сначала объекты с "test_cases", внутри групп - самые длинные первыми
+        return sorted(candidates, key=lambda candidate: (not self._has_test_cases(candidate[1]), -len(candidate[0])))
@@ -0,0 +1,64 @@
+from abc import ABC, abstractmethod
+import httpx
+import orjson
+from typing import Dict, Any
+from ..utils.file_classify import classify_file
+from ..utils.http_retry import make_client
+
+
+class VCSService(ABC):
+    """Common HTTP client and change analysis for the GitHub and GitLab services"""
+
+    # Key of the changed-files list in a changes payload
+    changes_key = ""
+
+    def __init__(self, api_token: str, base_url: str, auth_headers: Dict[str, str]):
+        self.api_token = api_token
+        self.base_url = base_url.rstrip('/')
+        self.headers = {
+            **auth_headers,
+            "Content-Type": "application/json"
+        }
+        self.client = make_client(self.headers)
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    async def _get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.client.get(url, **kwargs)
+
+    async def _post(self, url: str, data: Dict[str, Any]) -> httpx.Response:
+        return await self.client.post(url, content=orjson.dumps(data))
+
+    @abstractmethod
+    def _change_path(self, change: Dict[str, Any]) -> str:
+        """Path of a changed file entry"""
+
+    def analyze_code_changes(self, changes: Dict[str, Any]) -> str:
+        """Analyze code changes and suggest test impacts"""
+        parts = ["## Анализ изменений кода\n\n"]
+
+        if self.changes_key in changes:
+            test_impacts = []
+            for change in changes[self.changes_key]:
+                file_path = self._change_path(change)
+                kind = classify_file(file_path.lower())
+                if kind == "test":
+                    test_impacts.append(f"🔍 Изменен тестовый файл: `{file_path}`")
+                elif kind == "source":
+                    test_impacts.append(f"⚠️ Изменен исходный файл: `{file_path}` - требуется проверка тестов")
+
+            if test_impacts:
+                parts.append("### Возможное влияние на тесты:\n")
+                parts.extend(f"- {impact}\n" for impact in test_impacts)
+                parts.append("\nРекомендуется выполнить полный набор автотестов.")
+            else:
+                parts.append("Не обнаружено критических изменений, требующих обновления тестов.")
+
+        return "".join(parts)
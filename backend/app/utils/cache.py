@@ -0,0 +1,71 @@
+# app/utils/cache.py
+
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Iterator, Optional
+
+
+class LRUCache:
+    """Простой LRU-кэш фиксированного размера на OrderedDict."""
+
+    def __init__(self, maxsize: int = 128):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+
+    def get(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        try:
+            self._data.move_to_end(key)
+        except KeyError:
+            return default
+        return self._data[key]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def get_or_create(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """Возвращает значение из кэша или создает его через factory и запоминает."""
+        try:
+            self._data.move_to_end(key)
+            return self._data[key]
+        except KeyError:
+            value = factory()
+            self.set(key, value)
+            return value
+
+    def values(self) -> Iterator[Any]:
+        return iter(list(self._data.values()))
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class TTLCache:
+    """LRU-кэш, записи которого устаревают через ttl секунд."""
+
+    def __init__(self, maxsize: int = 128, ttl: float = 300.0):
+        self.ttl = ttl
+        self._data = LRUCache(maxsize)
+
+    def get(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            return default
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._data.set(key, (time.monotonic() + self.ttl, value))
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
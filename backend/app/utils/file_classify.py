@@ -0,0 +1,16 @@
+# app/utils/file_classify.py
+
+from typing import Literal
+
+# Все прежние шаблоны ('tests/', '__tests__/', 'test_', 'spec.ts', ...) содержат одну из этих подстрок
+_TEST_SUBSTRINGS = ('test', 'spec')
+_SOURCE_EXTS = ('.js', '.ts', '.jsx', '.tsx', '.py', '.java', '.cs', '.php', '.rb', '.go', '.rs', '.cpp', '.c')
+
+
+def classify_file(path_lower: str) -> Literal["test", "source", "other"]:
+    """Classify an already lower-cased file path as test, source or other"""
+    if any(pattern in path_lower for pattern in _TEST_SUBSTRINGS):
+        return "test"
+    if path_lower.endswith(_SOURCE_EXTS):
+        return "source"
+    return "other"
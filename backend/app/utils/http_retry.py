@@ -0,0 +1,111 @@
+# app/utils/http_retry.py
+
+import asyncio
+import random
+import time
+from typing import Dict, Optional
+
+import httpx
+
+
+_RETRY_STATUSES = frozenset({429, 502, 503, 504})
+# На эти ответы сервер запрос не обработал, поэтому повторяем даже POST/PATCH
+_REJECTED_STATUSES = frozenset({429})
+_IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+# Соединение не установлено - запрос не ушел на сервер, повтор безопасен для любого метода
+_NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout)
+
+# Дольше ждать сброса лимита в рамках одного HTTP-запроса к бэкенду нет смысла
+_MAX_RATE_LIMIT_WAIT = 60.0
+
+
+class RetryTransport(httpx.AsyncBaseTransport):
+    """Транспорт-обёртка: повторяет запросы с экспоненциальной задержкой и учитывает rate limit."""
+
+    def __init__(
+        self,
+        transport: httpx.AsyncBaseTransport,
+        max_attempts: int = 5,
+        initial_wait: float = 0.5,
+        max_wait: float = 30.0,
+    ):
+        self._transport = transport
+        self.max_attempts = max_attempts
+        self.initial_wait = initial_wait
+        self.max_wait = max_wait
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        idempotent = request.method in _IDEMPOTENT_METHODS
+        attempt = 1
+
+        while True:
+            try:
+                response = await self._transport.handle_async_request(request)
+            except httpx.TransportError as e:
+                if attempt >= self.max_attempts:
+                    raise
+                if not idempotent and not isinstance(e, _NOT_SENT_ERRORS):
+                    # ReadTimeout и т.п. на POST: сервер мог уже обработать запрос, повтор создаст дубликат
+                    raise
+                await asyncio.sleep(self._backoff(attempt))
+                attempt += 1
+                continue
+
+            if attempt >= self.max_attempts:
+                return response
+
+            delay = self._retry_delay(response, attempt, idempotent)
+            if delay is None:
+                return response
+
+            await response.aclose()
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+    def _retry_delay(self, response: httpx.Response, attempt: int, idempotent: bool) -> Optional[float]:
+        """Пауза перед повтором или None, если ответ нужно вернуть как есть."""
+        status = response.status_code
+
+        if status == 403 and response.headers.get("X-RateLimit-Remaining") == "0":
+            # GitHub: первичный лимит исчерпан, ждём сброса (если он скоро)
+            reset = response.headers.get("X-RateLimit-Reset")
+            if reset is None or not reset.isdigit():
+                return None
+            wait = max(0.0, int(reset) - time.time())
+            return wait if wait <= _MAX_RATE_LIMIT_WAIT else None
+
+        if status not in _RETRY_STATUSES:
+            return None
+        if not idempotent and status not in _REJECTED_STATUSES:
+            # 502/504 на POST: запрос мог уже выполниться, повтор создаст дубликат
+            return None
+
+        retry_after = response.headers.get("Retry-After")
+        if retry_after is not None and retry_after.isdigit():
+            wait = float(retry_after)
+            return wait if wait <= _MAX_RATE_LIMIT_WAIT else None
+
+        return self._backoff(attempt)
+
+    def _backoff(self, attempt: int) -> float:
+        """Экспоненциальная задержка с джиттером."""
+        return min(self.initial_wait * 2 ** (attempt - 1) + random.uniform(0, self.initial_wait), self.max_wait)
+
+
+def make_client(headers: Dict[str, str]) -> httpx.AsyncClient:
+    """Общий HTTP-клиент сервисов интеграций.
+
+    Один клиент на сервис: соединения (HTTP/2, если сервер поддерживает) переиспользуются
+    между вызовами, а повторы с задержкой при временных ошибках и rate limit общие для всех запросов.
+    """
+    return httpx.AsyncClient(
+        headers=headers,
+        timeout=30.0,
+        transport=RetryTransport(httpx.AsyncHTTPTransport(
+            http2=True,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10)
+        ))
+    )
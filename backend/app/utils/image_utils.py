@@ -0,0 +1,52 @@
+# app/utils/image_utils.py
+
+import asyncio
+import base64
+from typing import List, Optional
+
+
+def detect_image_media_type(image: bytes) -> str:
+    """Определяет MIME-тип изображения по сигнатуре файла (по умолчанию PNG)."""
+    if image.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if image.startswith((b"GIF87a", b"GIF89a")):
+        return "image/gif"
+    if image[:4] == b"RIFF" and image[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/png"
+
+
+def encode_image_base64(image: bytes) -> str:
+    """Кодирует изображение в base64-строку (вывод чистый ASCII, декодируем без UTF-8 проверки)."""
+    return base64.b64encode(image).decode("ascii")
+
+
+def image_data_url(image: bytes) -> str:
+    """Собирает data URL изображения с реальным MIME-типом (одна склейка вместо цепочки f-строк)."""
+    return "".join(("data:", detect_image_media_type(image), ";base64,", encode_image_base64(image)))
+
+
+async def _in_threads(func, images: List[bytes]) -> List[str]:
+    """Применяет func к каждому изображению в рабочих потоках: кодирование мегабайтных скриншотов не блокирует event loop."""
+    return list(await asyncio.gather(*(asyncio.to_thread(func, image) for image in images)))
+
+
+async def encode_images_base64(images: List[bytes]) -> List[str]:
+    """Кодирует изображения в base64 вне event loop (порядок сохраняется)."""
+    return await _in_threads(encode_image_base64, images)
+
+
+async def build_chat_messages(prompt: str, images: Optional[List[bytes]]) -> List[dict]:
+    """Собирает сообщения в формате OpenAI chat completions (OpenAI и OpenRouter), изображения - как data URL."""
+    if not images:
+        return [{"role": "user", "content": prompt}]
+
+    content = [{"type": "text", "text": prompt}]
+    for image_url in await _in_threads(image_data_url, images):
+        content.append({
+            "type": "image_url",
+            "image_url": {
+                "url": image_url
+            }
+        })
+    return [{"role": "user", "content": content}]
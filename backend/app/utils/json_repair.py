@@ -0,0 +1,17 @@
+# app/utils/json_repair.py
+
+import re
+
+# Строковый литерал JSON с учетом экранирования; незакрытая строка тянется до конца текста
+_JSON_STRING = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"?', re.DOTALL)
+# Переносы строк экранируются, CR удаляется, таб заменяется пробелом - одним проходом translate
+_STRING_CONTROL_CHARS = str.maketrans({'\n': '\\n', '\r': None, '\t': ' '})
+
+
+def _escape_literal(match: re.Match) -> str:
+    return match.group(0).translate(_STRING_CONTROL_CHARS)
+
+
+def escape_string_control_chars(json_str: str) -> str:
+    """Экранирует переносы строк и убирает табы/CR внутри строковых литералов JSON (вне строк текст не меняется)."""
+    return _JSON_STRING.sub(_escape_literal, json_str)
@@ -1,257 +1,233 @@
 # app/utils/xlsx_generator.py
 
 from io import BytesIO
-from typing import List, Dict, Any
-from datetime import datetime
-import openpyxl
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, Border, Side, PatternFill
-from openpyxl.utils import get_column_letter
+from typing import BinaryIO, List, Dict, Any, Tuple, Union
+import xlsxwriter
+
+
+# === СТИЛИ ===
+# Границы
+_BORDER_THIN = {"border": 1, "border_color": "#B4C7E7"}
+_BORDER_THICK_BOTTOM = {**_BORDER_THIN, "bottom": 2, "bottom_color": "#4472C4"}
+
+# Шрифты и выравнивание
+_NORMAL_FONT = {"font_name": "Calibri", "font_size": 10}
+_LEFT_TOP_ALIGN = {"align": "left", "valign": "top", "text_wrap": True}
+_CENTER_ALIGN = {"align": "center", "valign": "vcenter", "text_wrap": True}
+_LEFT_CENTER_ALIGN = {"align": "left", "valign": "vcenter", "text_wrap": True}
+
+_HEADER_STYLE = {
+    "font_name": "Calibri", "font_size": 11, "bold": True, "font_color": "#FFFFFF",
+    **_CENTER_ALIGN, "bg_color": "#4472C4", **_BORDER_THIN,
+}
+_NUMBER_STYLE = {
+    "font_name": "Calibri", "font_size": 11, "bold": True, "font_color": "#1F4E78",
+    **_CENTER_ALIGN, "bg_color": "#E7E6F7", **_BORDER_THIN,
+}
+_TITLE_STYLE = {**_NORMAL_FONT, "bold": True, **_LEFT_TOP_ALIGN, "bg_color": "#FFF2CC", **_BORDER_THIN}
+_PRECONDITION_STYLE = {**_NORMAL_FONT, **_LEFT_TOP_ALIGN, "bg_color": "#E2F0D9", **_BORDER_THIN}
+_STEPS_STYLE = {**_NORMAL_FONT, **_LEFT_TOP_ALIGN, "bg_color": "#FCE4D6", **_BORDER_THIN}
+_EXPECTED_STYLE = {**_NORMAL_FONT, **_LEFT_TOP_ALIGN, "bg_color": "#D9E2F3", **_BORDER_THIN}
+_COMMENT_STYLE = {**_NORMAL_FONT, **_LEFT_TOP_ALIGN, "bg_color": "#F2F2F2", **_BORDER_THIN}
+_FIELD_NUMBER_STYLE = {"bg_color": "#E7E6F7", **_BORDER_THIN}
+_FIELD_LABEL_STYLE = {
+    "font_name": "Calibri", "font_size": 10, "bold": True, "font_color": "#1F4E78",
+    **_LEFT_CENTER_ALIGN, "bg_color": "#DDEBF7", **_BORDER_THIN,
+}
+_FIELD_VALUE_STYLE = {**_NORMAL_FONT, **_LEFT_TOP_ALIGN, "bg_color": "#FFFFFF", **_BORDER_THIN}
+_SEPARATOR_STYLE = _BORDER_THICK_BOTTOM
+
+# === ШИРИНА КОЛОНОК (по индексу, A..F) ===
+_COLUMN_WIDTHS = (
+    5,   # Номер
+    30,  # Название
+    28,  # Предусловие
+    40,  # Шаги
+    40,  # Ожидаемый результат
+    25,  # Комментарий
+)
+
+# === ДОПОЛНИТЕЛЬНЫЕ ПОЛЯ ===
+# Метки в порядке вывода; значения собирает _prepare_test_case в том же порядке
+_ADDITIONAL_FIELD_LABELS = ("Описание:", "Контекст:", "Приоритет:", "Результат:")
+_PRIORITY_NOT_SET = "Не указано"
 
 
 def generate_xlsx_bytes(test_cases: List[Dict[str, Any]]) -> bytes:
-    wb: Workbook = Workbook()
-    ws = wb.active
-    ws.title = "Тест-кейсы"
+    bio = BytesIO()
+    write_xlsx(test_cases, bio)
+    return bio.getvalue()
+
+
+def write_xlsx(test_cases: List[Dict[str, Any]], target: Union[str, BinaryIO]) -> None:
+    """Записывает тест-кейсы в XLSX по пути к файлу или в файловый объект."""
+    # constant_memory: строки сбрасываются по мере записи, не держим весь лист в памяти.
+    # strings_to_formulas/strings_to_urls: текст от LLM, попадающий в write()/merge_range
+    # (например, "=HYPERLINK(...)" или URL), сохраняется как строка, а не формула или ссылка
+    wb = xlsxwriter.Workbook(target, {
+        "constant_memory": True,
+        "strings_to_formulas": False,
+        "strings_to_urls": False,
+    })
+    ws = wb.add_worksheet("Тест-кейсы")
 
     # === СТИЛИ ===
-    # Шрифты
-    header_font = Font(bold=True, size=11, color="FFFFFF", name="Calibri")
-    field_label_font = Font(bold=True, size=10, color="1F4E78", name="Calibri")
-    normal_font = Font(size=10, name="Calibri")
-    number_font = Font(bold=True, size=11, color="1F4E78", name="Calibri")
-    
-    # Выравнивание
-    header_align = Alignment(horizontal="center", vertical="center", wrap_text=True)
-    center_align = Alignment(horizontal="center", vertical="center", wrap_text=True)
-    left_top_align = Alignment(horizontal="left", vertical="top", wrap_text=True)
-    left_center_align = Alignment(horizontal="left", vertical="center", wrap_text=True)
-    
-    # Границы
-    thin_side = Side(border_style="thin", color="B4C7E7")
-    medium_side = Side(border_style="medium", color="4472C4")
-    border_thin = Border(top=thin_side, left=thin_side, right=thin_side, bottom=thin_side)
-    border_thick_bottom = Border(top=thin_side, left=thin_side, right=thin_side, bottom=medium_side)
-    
-    # Заливки
-    header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
-    number_fill = PatternFill(start_color="E7E6F7", end_color="E7E6F7", fill_type="solid")
-    title_fill = PatternFill(start_color="FFF2CC", end_color="FFF2CC", fill_type="solid")
-    precondition_fill = PatternFill(start_color="E2F0D9", end_color="E2F0D9", fill_type="solid")
-    steps_fill = PatternFill(start_color="FCE4D6", end_color="FCE4D6", fill_type="solid")
-    expected_fill = PatternFill(start_color="D9E2F3", end_color="D9E2F3", fill_type="solid")
-    comment_fill = PatternFill(start_color="F2F2F2", end_color="F2F2F2", fill_type="solid")
-    field_label_fill = PatternFill(start_color="DDEBF7", end_color="DDEBF7", fill_type="solid")
-    field_value_fill = PatternFill(start_color="FFFFFF", end_color="FFFFFF", fill_type="solid")
-
-    # === ЗАГОЛОВОК ===
-    headers = ["№", "Название", "Предусловие", "Шаги", "Ожидаемый результат", "Комментарий"]
-    ws.append(headers)
-    ws.row_dimensions[1].height = 40
-
-    for col_idx, header in enumerate(headers, start=1):
-        cell = ws.cell(row=1, column=col_idx)
-        cell.font = header_font
-        cell.alignment = header_align
-        cell.fill = header_fill
-        cell.border = border_thin
+    # Форматы привязаны к книге: регистрируем каждый один раз и переиспользуем
+    header_fmt = wb.add_format(_HEADER_STYLE)
+    number_fmt = wb.add_format(_NUMBER_STYLE)
+    title_fmt = wb.add_format(_TITLE_STYLE)
+    precondition_fmt = wb.add_format(_PRECONDITION_STYLE)
+    steps_fmt = wb.add_format(_STEPS_STYLE)
+    expected_fmt = wb.add_format(_EXPECTED_STYLE)
+    comment_fmt = wb.add_format(_COMMENT_STYLE)
+    field_number_fmt = wb.add_format(_FIELD_NUMBER_STYLE)
+    field_label_fmt = wb.add_format(_FIELD_LABEL_STYLE)
+    field_value_fmt = wb.add_format(_FIELD_VALUE_STYLE)
+    separator_fmt = wb.add_format(_SEPARATOR_STYLE)
+    # Форматы текстовых ячеек основной строки по порядку колонок B..F
+    text_fmts = (title_fmt, precondition_fmt, steps_fmt, expected_fmt, comment_fmt)
 
     # === ШИРИНА КОЛОНОК ===
-    column_widths = {
-        'A': 5,   # Номер
-        'B': 30,  # Название
-        'C': 28,  # Предусловие
-        'D': 40,  # Шаги
-        'E': 40,  # Ожидаемый результат
-        'F': 25   # Комментарий
-    }
-    
-    for col_letter, width in column_widths.items():
-        ws.column_dimensions[col_letter].width = width
+    for col_idx, width in enumerate(_COLUMN_WIDTHS):
+        ws.set_column(col_idx, col_idx, width)
 
     # Закрепление заголовка
-    ws.freeze_panes = "A2"
+    ws.freeze_panes(1, 0)
 
-    current_row = 2
+    # === ЗАГОЛОВОК ===
+    headers = ["№", "Название", "Предусловие", "Шаги", "Ожидаемый результат", "Комментарий"]
+    ws.set_row(0, 40)
+    ws.write_row(0, 0, headers, header_fmt)
+
+    current_row = 1
 
     # === ГЕНЕРАЦИЯ ТЕСТ-КЕЙСОВ ===
     for idx, raw_tc in enumerate(test_cases, start=1):
-        # Нормализация данных
-        tc = {
-            "title": raw_tc.get("title", "") or raw_tc.get("name", "") or "",
-            "preconditions": raw_tc.get("preconditions", "") or raw_tc.get("setup", "") or "",
-            "steps": raw_tc.get("steps", []),
-            "expectedResult": raw_tc.get("expectedResult", "") or raw_tc.get("expected", "") or "",
-            "description": raw_tc.get("description", "") or raw_tc.get("desc", "") or "",
-            "context": raw_tc.get("context", "") or raw_tc.get("extra", "") or "",
-            "result": raw_tc.get("result", "") or "",
-            "priority": raw_tc.get("priority") or "Не указано",
-        }
-
-        # Форматирование шагов
-        steps_text = _format_steps(tc["steps"])
-        expected_text = _format_expected(tc["steps"])
+        row_height, texts, additional_rows = _prepare_test_case(raw_tc)
 
         # === ОСНОВНАЯ СТРОКА ===
-        ws.append([
-            idx,
-            tc["title"],
-            tc["preconditions"],
-            steps_text,
-            expected_text,
-            tc["expectedResult"]
-        ])
-        
         main_row = current_row
-        
-        # Стили для основной строки
+
+        # Высота строки (в режиме constant_memory задаётся до записи ячеек)
+        ws.set_row(main_row, row_height)
+
         # Номер
-        cell_num = ws.cell(row=main_row, column=1)
-        cell_num.font = number_font
-        cell_num.alignment = center_align
-        cell_num.fill = number_fill
-        cell_num.border = border_thin
-        
-        # Название
-        cell_title = ws.cell(row=main_row, column=2)
-        cell_title.font = Font(bold=True, size=10, name="Calibri")
-        cell_title.alignment = left_top_align
-        cell_title.fill = title_fill
-        cell_title.border = border_thin
-        
-        # Предусловие
-        cell_pre = ws.cell(row=main_row, column=3)
-        cell_pre.font = normal_font
-        cell_pre.alignment = left_top_align
-        cell_pre.fill = precondition_fill
-        cell_pre.border = border_thin
-        
-        # Шаги
-        cell_steps = ws.cell(row=main_row, column=4)
-        cell_steps.font = normal_font
-        cell_steps.alignment = left_top_align
-        cell_steps.fill = steps_fill
-        cell_steps.border = border_thin
-        
-        # Ожидаемый результат
-        cell_exp = ws.cell(row=main_row, column=5)
-        cell_exp.font = normal_font
-        cell_exp.alignment = left_top_align
-        cell_exp.fill = expected_fill
-        cell_exp.border = border_thin
-        
-        # Комментарий
-        cell_com = ws.cell(row=main_row, column=6)
-        cell_com.font = normal_font
-        cell_com.alignment = left_top_align
-        cell_com.fill = comment_fill
-        cell_com.border = border_thin
-        
-        # Высота строки
-        ws.row_dimensions[main_row].height = _calculate_row_height([
-            tc["title"],
-            tc["preconditions"],
-            steps_text,
-            expected_text,
-            tc["expectedResult"]
-        ])
-        
+        ws.write_number(main_row, 0, idx, number_fmt)
+        # Название, предусловие, шаги, ожидаемый результат, комментарий
+        for col_idx, (text, fmt) in enumerate(zip(texts, text_fmts), start=1):
+            ws.write_string(main_row, col_idx, text, fmt)
+
         current_row += 1
 
         # === ДОПОЛНИТЕЛЬНЫЕ ПОЛЯ ===
-        additional_fields = [
-            ("Описание:", tc["description"]),
-            ("Контекст:", tc["context"]),
-            ("Приоритет:", tc["priority"]),
-            ("Результат:", tc["result"])
-        ]
-
-        for field_label, field_value in additional_fields:
-            if field_value and str(field_value).strip():
-                ws.append(["", field_label, field_value, "", "", ""])
-                field_row = current_row
-                
-                # Объединение ячеек для значения
-                ws.merge_cells(start_row=field_row, start_column=3, end_row=field_row, end_column=6)
-                
-                # Пустая ячейка номера
-                ws.cell(row=field_row, column=1).border = border_thin
-                ws.cell(row=field_row, column=1).fill = number_fill
-                
-                # Метка поля
-                label_cell = ws.cell(row=field_row, column=2)
-                label_cell.font = field_label_font
-                label_cell.alignment = left_center_align
-                label_cell.fill = field_label_fill
-                label_cell.border = border_thin
-                
-                # Значение поля
-                value_cell = ws.cell(row=field_row, column=3)
-                value_cell.font = normal_font
-                value_cell.alignment = left_top_align
-                value_cell.fill = field_value_fill
-                value_cell.border = border_thin
-                
-                # Высота строки
-                ws.row_dimensions[field_row].height = min(max(15 * len(str(field_value).splitlines()), 20), 120)
-                
-                current_row += 1
+        for field_label, field_value, field_height in additional_rows:
+            field_row = current_row
+
+            # Высота строки
+            ws.set_row(field_row, field_height)
+
+            # Пустая ячейка номера
+            ws.write_blank(field_row, 0, None, field_number_fmt)
+
+            # Метка поля
+            ws.write_string(field_row, 1, field_label, field_label_fmt)
+
+            # Значение поля, объединённое на колонки C:F
+            ws.merge_range(field_row, 2, field_row, 5, field_value, field_value_fmt)
+
+            current_row += 1
 
         # === РАЗДЕЛИТЕЛЬ ===
-        ws.append(["", "", "", "", "", ""])
         sep_row = current_row
-        
-        for col_idx in range(1, 7):
-            sep_cell = ws.cell(row=sep_row, column=col_idx)
-            sep_cell.border = border_thick_bottom
-        
-        ws.row_dimensions[sep_row].height = 8
-        current_row += 1
+        ws.set_row(sep_row, 8)
 
-    # === СОХРАНЕНИЕ ===
-    bio = BytesIO()
-    wb.save(bio)
-    bio.seek(0)
-    return bio.read()
+        for col_idx in range(6):
+            ws.write_blank(sep_row, col_idx, None, separator_fmt)
 
+        current_row += 1
 
-def _format_steps(steps_list: List[Dict[str, Any]]) -> str:
-    """Форматирует список шагов с нумерацией."""
+    # === СОХРАНЕНИЕ ===
+    wb.close()
+
+
+def _prepare_test_case(raw_tc: Dict[str, Any]) -> Tuple[int, Tuple[str, ...], List[Tuple[str, str, int]]]:
+    """Готовит всё содержимое строк тест-кейса без обращения к листу.
+
+    Возвращает высоту основной строки, тексты её ячеек B..F (название, предусловие,
+    шаги, ожидаемый результат, комментарий) и непустые дополнительные поля
+    в виде (метка, значение, высота строки).
+    """
+    # Нормализация данных (в локальные переменные, без промежуточного словаря)
+    title = raw_tc.get("title") or raw_tc.get("name") or ""
+    preconditions = raw_tc.get("preconditions") or raw_tc.get("setup") or ""
+    steps = raw_tc.get("steps")
+    expected_result = raw_tc.get("expectedResult") or raw_tc.get("expected") or ""
+    description = raw_tc.get("description") or raw_tc.get("desc") or ""
+    context = raw_tc.get("context") or raw_tc.get("extra") or ""
+    result = raw_tc.get("result") or ""
+    # "Не указано" только для отсутствующего приоритета; 0 и прочие заданные значения выводим как есть
+    priority = raw_tc.get("priority")
+    if priority is None or priority == "":
+        priority = _PRIORITY_NOT_SET
+
+    # Форматирование шагов и ожидаемых результатов за один проход
+    steps_text, expected_text, steps_lines = _format_steps_and_expected(steps)
+
+    row_height = _calculate_row_height([
+        title,
+        preconditions,
+        expected_result
+    ], steps_lines)
+
+    additional_rows = []
+    for field_label, field_value in zip(_ADDITIONAL_FIELD_LABELS, (description, context, priority, result)):
+        field_value = str(field_value)
+        # Значения нормализованы выше и не бывают None; проверяем только на пустую строку
+        if field_value.strip():
+            additional_rows.append((field_label, field_value, min(max(15 * _count_lines(field_value), 20), 120)))
+
+    texts = (str(title), str(preconditions), steps_text, expected_text, str(expected_result))
+    return row_height, texts, additional_rows
+
+
+def _format_steps_and_expected(steps_list: List[Dict[str, Any]]) -> Tuple[str, str, int]:
+    """Форматирует шаги и ожидаемые результаты с нумерацией за один проход.
+
+    Возвращает оба текста и число строк в более длинном из них.
+    """
     if not steps_list:
-        return ""
-    
-    lines = []
+        return "", "", 0
+
+    step_lines = []
+    expected_lines = []
     for i, step in enumerate(steps_list):
-        step_no = step.get("step") if step.get("step") is not None else i + 1
+        step_no = step.get("step")
+        if step_no is None:
+            step_no = i + 1
         action = step.get("action") or step.get("description") or ""
         if action:
-            lines.append(f"{step_no}. {action}")
-    
-    return "\n\n".join(lines)
-
-
-def _format_expected(steps_list: List[Dict[str, Any]]) -> str:
-    """Форматирует ожидаемые результаты для шагов."""
-    if not steps_list:
-        return ""
-    
-    lines = []
-    for i, step in enumerate(steps_list):
-        step_no = step.get("step") if step.get("step") is not None else i + 1
+            step_lines.append(f"{step_no}. {action}")
         expected = step.get("expected") or step.get("expected_result") or ""
         if expected:
-            lines.append(f"{step_no}. {expected}")
-    
-    return "\n\n".join(lines)
+            expected_lines.append(f"{step_no}. {expected}")
+
+    steps_text = "\n\n".join(step_lines)
+    expected_text = "\n\n".join(expected_lines)
+    return steps_text, expected_text, max(_count_lines(steps_text), _count_lines(expected_text))
+
+
+def _count_lines(text: str) -> int:
+    """Число строк текста без построения списка строк (как len(splitlines()))."""
+    if not text:
+        return 0
+    return text.count("\n") + (not text.endswith("\n"))
 
 
-def _calculate_row_height(texts: List[str], base: int = 16, max_height: int = 300) -> int:
+def _calculate_row_height(texts: List[str], max_lines: int = 1, base: int = 16, max_height: int = 300) -> int:
     """Вычисляет оптимальную высоту строки."""
-    max_lines = 1
     for text in texts:
         if text:
-            lines = len(str(text).splitlines())
-            max_lines = max(max_lines, lines)
+            max_lines = max(max_lines, _count_lines(str(text)))
     
     # Учитываем двойные переносы между шагами
     calculated = base * max(max_lines, 2) + 10